@@ -86,58 +86,31 @@ export default function HistoryScreen() {
   const fetchHistory = async () => {
     try {
       const token = await SecureStore.getItemAsync('auth_token');
-      const response = await axios.get(`${API_BASE}user/history`, {
+      const response = await axios.get(`${API_BASE}user/history?expand=author`, {
         headers: {
           Authorization: `Bearer ${token}`
         }
       });
       console.log('History response:', response.data);
 
-      // Process each history item to include author information
-      const processedHistory = await Promise.all(response.data.map(async (item: any) => {
-        try {
-          // Fetch author information using the author_post (email)
-          const authorResponse = await axios.get(`${API_BASE}user/email/${item.post.author_post}/`, {
-            headers: {
-              Authorization: `Bearer ${token}`
-            }
-          });
-
-          return {
-            id: item.id,
-            post: {
-              id: item.post.id,
-              depart_place: item.post.depart_place,
-              arrival_place: item.post.arrival_place,
-              depart_date: item.post.depart_date,
-              arrival_date: item.post.arrival_date,
-              price: item.post.price,
-              author_post: item.post.author_post
-            },
-            visited_at: item.visited_at,
-            author: {
-              id: authorResponse.data.user.id,
-              username: authorResponse.data.user.username,
-              user_pic: authorResponse.data.user.user_pic
-            }
-          };
-        } catch (error) {
-          console.error("Error fetching author info:", error);
-          return {
-            id: item.id,
-            post: {
-              id: item.post.id,
-              depart_place: item.post.depart_place,
-              arrival_place: item.post.arrival_place,
-              depart_date: item.post.depart_date,
-              arrival_date: item.post.arrival_date,
-              price: item.post.price,
-              author_post: item.post.author_post
-            },
-            visited_at: item.visited_at,
-            author: null
-          };
-        }
+      // The author profile is inlined by the API (?expand=author)
+      const processedHistory = response.data.map((item: any) => ({
+        id: item.id,
+        post: {
+          id: item.post.id,
+          depart_place: item.post.depart_place,
+          arrival_place: item.post.arrival_place,
+          depart_date: item.post.depart_date,
+          arrival_date: item.post.arrival_date,
+          price: item.post.price,
+          author_post: item.post.author_post
+        },
+        visited_at: item.visited_at,
+        author: item.post.author ? {
+          id: item.post.author.id,
+          username: item.post.author.username,
+          user_pic: item.post.author.user_pic
+        } : null
       }));
 
       setHistory(processedHistory);
@@ -54,6 +54,7 @@ const ProfileScreen = () => {
   const [refreshing, setRefreshing] = useState(false);
   const [comments, setComments] = useState<Comment[]>([]);
   const [averageRating, setAverageRating] = useState(0);
+  const [token, setToken] = useState<string | null>(null); // the permis scan is only served with it
 
   const fetchProfile = async () => {
     if (!authUser?.user?.username) {
@@ -76,6 +77,7 @@ const ProfileScreen = () => {
           }
         }
       );
+      setToken(token);
       setProfile(response.data);
       setError(null);
     } catch (err) {
@@ -285,7 +287,8 @@ const ProfileScreen = () => {
                   <Text style={styles.info}>📄 {profile.user.type_user === 'conducteur' ? 'Permis de conduire' : 'Carte d\'identité'}</Text>
                   <Image
                     source={{
-                      uri: getImageUrl(profile.user.ppermis_ic) || ''
+                      uri: getImageUrl(profile.user.ppermis_ic) || '',
+                      headers: token ? { 'Authorization': `Bearer ${token}` } : undefined
                     }}
                     style={styles.permisImage}
                     onError={(e) => {
@@ -6,6 +6,7 @@ import { router } from 'expo-router';
 import { Animated } from 'react-native';
 import * as SecureStore from 'expo-secure-store';
 import { useAuth } from '../../context/AuthContext';
+import { useNotifications } from '../../hooks/useNotifications';
 import axios from 'axios';
 import defaultProfilePic from '../../assets/images/photo_profil.jpg';
 
@@ -73,7 +74,7 @@ function formatHourString(dateString: string) {
     console.error("Erreur lors du formatage de la date:", error);
   }
   
-  // Fallback pour le format HH:mm si la date complète n'est pas valide
+  // Fallback pour l'ancien format HH:mm:ss (heure sans date)
   const [hour, minute] = dateString.split(':');
   if (hour && minute) {
     return `${hour.padStart(2, '0')}:${minute.padStart(2, '0')}`;
@@ -135,14 +136,9 @@ export default function DriverReservationsScreen() {
         const activePost = posts[0];
         console.log("Post actif:", activePost);
 
-        const formattedPost = {
-          ...activePost,
-          depart_date: new Date(`2000-01-01T${activePost.depart_date}`).toLocaleTimeString(),
-          arrival_date: new Date(`2000-01-01T${activePost.arrival_date}`).toLocaleTimeString()
-        };
-
+        // depart_date / arrival_date sont des dates ISO, formatées à l'affichage (formatHourString)
         setActiveTrip({
-          post: formattedPost,
+          post: activePost,
           hasReservations: activePost.reserved
         });
       } else {
@@ -281,15 +277,25 @@ export default function DriverReservationsScreen() {
     );
   };
 
+  // les réservations et annulations arrivent par le websocket, on ne
+  // recharge périodiquement que lorsqu'il n'est pas connecté
+  const connected = useNotifications((event) => {
+    if (event.type === 'reservation' || event.type === 'cancellation') {
+      fetchActiveTrip();
+      fetchReservations();
+    }
+  });
+
   useEffect(() => {
     fetchActiveTrip();
     fetchReservations();
+    if (connected) return;
     const interval = setInterval(() => {
       fetchActiveTrip();
       fetchReservations();
     }, 30000);
     return () => clearInterval(interval);
-  }, []);
+  }, [connected]);
 
   return (
     <SafeAreaView style={styles.container}>
@@ -377,11 +377,23 @@ const RideItem = React.memo(({ ride, onReserve, onCancel, disabled }: RideItemPr
     onReserve();
   };
 
-  // Fonction pour formater l'heure
+  // Fonction pour formater l'heure (date ISO, "JJ/MM HH:mm" si ce n'est pas aujourd'hui)
   const formatTime = (timeString: string) => {
     try {
-      const [hours, minutes] = timeString.split(':');
-      return `${hours}:${minutes}`;
+      const date = new Date(timeString);
+      if (isNaN(date.getTime())) {
+        // ancien format HH:mm:ss
+        const [hours, minutes] = timeString.split(':');
+        return `${hours}:${minutes}`;
+      }
+      const hours = date.getHours().toString().padStart(2, '0');
+      const minutes = date.getMinutes().toString().padStart(2, '0');
+      if (date.toDateString() === new Date().toDateString()) {
+        return `${hours}:${minutes}`;
+      }
+      const day = date.getDate().toString().padStart(2, '0');
+      const month = (date.getMonth() + 1).toString().padStart(2, '0');
+      return `${day}/${month} ${hours}:${minutes}`;
     } catch (error) {
       return timeString;
     }
@@ -0,0 +1,63 @@
+import { useEffect, useRef, useState } from 'react';
+import * as SecureStore from 'expo-secure-store';
+
+const WS_URL = 'ws://10.0.2.2:8000/ws/notifications/';
+
+export type NotificationEvent = {
+  id: number;
+  type: 'reservation' | 'cancellation' | 'comment';
+  at: string;
+  [key: string]: unknown;
+};
+
+/**
+ * Opens the notification websocket of the logged in user (served by uvicorn)
+ * and calls onEvent for every reservation / cancellation / comment event.
+ * Reconnects with a growing delay; returns whether the socket is open so a
+ * screen can keep polling while it is not.
+ */
+export function useNotifications(onEvent: (event: NotificationEvent) => void) {
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+  const [connected, setConnected] = useState(false);
+
+  useEffect(() => {
+    let socket: WebSocket | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let delay = 1000;
+    let stopped = false;
+
+    const connect = async () => {
+      const token = await SecureStore.getItemAsync('auth_token');
+      if (stopped || !token) return;
+      socket = new WebSocket(`${WS_URL}?token=${encodeURIComponent(token)}`);
+      socket.onopen = () => {
+        delay = 1000;
+        setConnected(true);
+      };
+      socket.onmessage = (message) => {
+        try {
+          handler.current(JSON.parse(message.data));
+        } catch (error) {
+          console.error("Notification illisible:", error);
+        }
+      };
+      socket.onclose = () => {
+        setConnected(false);
+        if (!stopped) {
+          retry = setTimeout(connect, delay);
+          delay = Math.min(delay * 2, 60000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retry);
+      socket?.close();
+    };
+  }, []);
+
+  return connected;
+}
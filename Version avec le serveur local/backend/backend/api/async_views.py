@@ -0,0 +1,151 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.models import comments_rating
+from .cache import AsyncCachedResponseMixin
+from .notifications import broker
+from .views import GetPosts, GetHistory, GetComment, GetCommentemail, UserProfileView, UserProfileViewmail, UserselfView
+
+# async twins of the read heavy views, mounted under api/async/ for uvicorn
+# (backend.asgi). They reuse everything of the sync view (permissions,
+# querysets, eager loading, serializers, pagination) but dispatch as a
+# coroutine, so a worker waiting on the database or on a slow phone is not
+# holding a thread. The serializers only read what was eager loaded: a
+# lazy query in there raises SynchronousOnlyOperation instead of blocking.
+
+
+class AsyncAPIViewMixin:
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch, awaiting the handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # authentication may look the user up when the cache is cold
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListMixin(AsyncAPIViewMixin):
+
+    async def aget_queryset(self):
+        # the sync get_queryset only builds the query, override when it
+        # runs one
+        return self.get_queryset()
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(await self.aget_queryset())
+        if getattr(self, 'flat_serializer_class', None) is not None:  # FlatListMixin
+            flat = self.get_flat_serializer()
+            queryset = flat.setup(queryset)
+            serialize = flat.to_representation
+        else:
+            serialize = lambda rows: self.get_serializer(rows, many=True).data  # noqa: E731
+        # DRF's cursor pagination reads the rows itself, like the async
+        # ORM it runs on the thread of the request
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        rows = [row async for row in queryset]
+        return Response(serialize(rows))
+
+
+class AsyncRetrieveMixin(AsyncAPIViewMixin):
+
+    async def get(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instance = await aget_object_or_404(
+            self.filter_queryset(self.get_queryset()), **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, instance)
+        return Response(self.get_serializer(instance).data)
+
+
+# posts
+
+class AsyncGetPosts(AsyncListMixin, GetPosts):
+    pass
+
+
+# history
+
+class AsyncGetHistory(AsyncListMixin, GetHistory):
+    pass
+
+
+# comments
+
+class AsyncGetComment(AsyncCachedResponseMixin, AsyncListMixin, GetComment):
+
+    async def aget_queryset(self):
+        return comments_rating.objects.filter(received_user=await self.aget_received_user())
+
+
+class AsyncGetCommentemail(AsyncCachedResponseMixin, AsyncListMixin, GetCommentemail):
+
+    async def aget_queryset(self):
+        return comments_rating.objects.filter(received_user=await self.aget_received_user())
+
+
+# profiles
+
+class AsyncUserProfileView(AsyncCachedResponseMixin, AsyncRetrieveMixin, UserProfileView):
+    pass
+
+
+class AsyncUserProfileViewmail(AsyncCachedResponseMixin, AsyncRetrieveMixin, UserProfileViewmail):
+    pass
+
+
+class AsyncUserselfView(AsyncCachedResponseMixin, AsyncRetrieveMixin, UserselfView):
+    pass
+
+
+# notifications, for the clients that can't open a websocket
+
+class NotificationStream(AsyncAPIViewMixin, APIView):
+    # server sent events: one `data: {json}` message per event of
+    # api.notifications, and a comment line every `heartbeat` seconds so
+    # proxies keep the connection open
+    permission_classes = [IsAuthenticated]
+    heartbeat = 15
+
+    async def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(self.stream(request.user.pk), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx would hold the events back
+        return response
+
+    async def stream(self, user_id):
+        # subscribed once the response starts, django closes the generator
+        # when the client goes away
+        subscription = broker.subscribe(user_id)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
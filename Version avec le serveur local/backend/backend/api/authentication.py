@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt import tokens
+from users.models import profile
+from .blacklist import blacklist_cache
+from .models import token_profile
+
+# profile fields copied into the tokens, enough to serve most requests
+# without reading the profile table. is_staff is not one of them, it is
+# re-read with is_active (account_state)
+CLAIMS = ("email", "username", "type_user")
+
+
+class RefreshToken(tokens.RefreshToken):
+    # blacklist checks go through the in-process bloom filter first
+
+    def check_blacklist(self):
+        if blacklist_cache.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        blacklist_cache.add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
+
+
+def add_claims(token, user):
+    for claim in CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def tokens_for_user(user):
+    # the access token derived from this refresh token carries the claims too
+    return add_claims(RefreshToken.for_user(user), user)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class CachedBlacklistTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+def active_cache_key(user_id):
+    return f"auth:active:{user_id}"
+
+
+def account_state(user_id):
+    # (is_active, is_staff): a deactivated, deleted or demoted user is
+    # refused at most AUTH_ACTIVE_CACHE_TTL seconds later (sooner in this
+    # process, see api.signals)
+    key = active_cache_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = profile.objects.filter(pk=user_id).values_list('is_active', 'is_staff').first() or (False, False)
+        cache.set(key, tuple(state), getattr(settings, "AUTH_ACTIVE_CACHE_TTL", 60))
+    return state
+
+
+def is_active(user_id):
+    return account_state(user_id)[0]
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    # builds request.user from the token claims instead of loading the
+    # profile row on every request
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in CLAIMS):
+            # token issued before the claims were added
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        active, staff = account_state(user_id)
+        if not active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        user = token_profile(
+            id=user_id,
+            is_active=True,
+            is_staff=staff,
+            **{claim: validated_token[claim] for claim in CLAIMS},
+        )
+        user._state.adding = False
+        user._state.db = "default"
+        return user
+
+
+def request_user(request):
+    # the user of a plain django view (media, middleware): the app sends its
+    # JWT as for the api, the admin has its session. None when anonymous or
+    # the token is refused
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        authenticated = ClaimsJWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
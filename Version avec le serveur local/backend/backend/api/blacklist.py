@@ -0,0 +1,153 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+
+class BloomFilter:
+    # fixed size set of strings: no false negatives, about error_rate false
+    # positives once `capacity` items have been added
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistCache:
+    # in-process front of the token_blacklist table. The bloom filter holds
+    # every blacklisted jti this process knows of; a miss means "not
+    # blacklisted" with no lookup, a hit is confirmed against the table (and
+    # remembered in a small LRU). Rows blacklisted by other processes are
+    # pulled with an id range query at most every `sync_interval` seconds.
+    # Ids are taken at insert but rows show up at commit, so a row can land
+    # below the last id seen: every pull reads the last `sync_window` ids
+    # again.
+    # A refresh runs without the lock, on one request: the others keep the
+    # previous filter (or ask the table while the first one is built) and
+    # the new filter is swapped in once loaded.
+
+    def __init__(self, capacity=100_000, sync_interval=5, sync_window=1000, lru_size=1024, max_age=86_400):
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        self.sync_window = sync_window
+        self.lru_size = lru_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._last_id = 0
+            self._synced_at = None
+            self._built_at = None
+            self._confirmed = OrderedDict()
+            self._refreshing = False
+            self._added = None  # jtis added while a new filter is loading
+
+    def _rows(self, since_id):
+        return list(
+            BlacklistedToken.objects.filter(id__gt=since_id)
+            .order_by('id').values_list('id', 'token__jti')
+        )
+
+    def _due(self, now):
+        # under the lock: the refresh this request has to run, if any
+        if self._refreshing:
+            return None
+        expired = self._built_at is None or now - self._built_at > self.max_age
+        if expired or self._bloom.count > self.capacity:
+            return self._rebuild
+        if now - self._synced_at >= self.sync_interval:
+            return self._pull
+        return None
+
+    def _rebuild(self, now):
+        # start over: drops purged tokens and grows past the capacity
+        capacity = max(self.capacity, BlacklistedToken.objects.count() * 2)
+        bloom = BloomFilter(capacity)
+        with self._lock:
+            self._added = []
+        last_id = 0
+        for row_id, jti in self._rows(0):
+            bloom.add(jti)
+            last_id = row_id
+        with self._lock:
+            for jti in self._added:
+                bloom.add(jti)
+            self._added = None
+            self._bloom, self._last_id, self.capacity = bloom, last_id, capacity
+            self._confirmed.clear()
+            self._built_at = self._synced_at = now
+
+    def _pull(self, now):
+        rows = self._rows(max(0, self._last_id - self.sync_window))
+        with self._lock:
+            for row_id, jti in rows:
+                if jti not in self._bloom:
+                    self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._synced_at = now
+
+    def _remember(self, jti):
+        self._confirmed[jti] = True
+        self._confirmed.move_to_end(jti)
+        if len(self._confirmed) > self.lru_size:
+            self._confirmed.popitem(last=False)
+
+    def is_blacklisted(self, jti):
+        now = time.monotonic()
+        with self._lock:
+            refresh = self._due(now)
+            self._refreshing = self._refreshing or refresh is not None
+        if refresh is not None:
+            try:
+                refresh(now)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        with self._lock:
+            if jti in self._confirmed:
+                return True
+            if self._bloom is not None and jti not in self._bloom:
+                return False
+        blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        if blacklisted:
+            with self._lock:
+                self._remember(jti)
+        return blacklisted
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+                self._remember(jti)
+            if self._added is not None:
+                self._added.append(jti)
+
+
+blacklist_cache = BlacklistCache(
+    capacity=getattr(settings, 'BLACKLIST_FILTER_CAPACITY', 100_000),
+    sync_interval=getattr(settings, 'BLACKLIST_SYNC_INTERVAL', 5),
+    sync_window=getattr(settings, 'BLACKLIST_SYNC_WINDOW', 1000),
+)
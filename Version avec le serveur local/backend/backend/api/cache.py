@@ -0,0 +1,127 @@
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def response_cache():
+    return caches['responses']
+
+
+def version_key(user_id):
+    return f"resp:user:{user_id}:version"
+
+
+def get_version(user_id):
+    cache = response_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        cache.add(version_key(user_id), time.time_ns(), None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+async def aget_version(user_id):
+    cache = response_cache()
+    version = await cache.aget(version_key(user_id))
+    if version is None:
+        await cache.aadd(version_key(user_id), time.time_ns(), None)
+        version = await cache.aget(version_key(user_id))
+    return version
+
+
+def invalidate_user(user_id):
+    # every cached response built from this user's profile or comments
+    # becomes stale, whatever url (username, email, id) it was cached under.
+    # Again after the commit: a response read between the signal and the
+    # commit saw the old rows
+    if user_id is not None:
+        key = version_key(user_id)
+        response_cache().delete(key)
+        transaction.on_commit(lambda: response_cache().delete(key))
+
+
+def make_etag(data):
+    body = json.dumps(data, sort_keys=True, default=str).encode()
+    return quote_etag(hashlib.md5(body).hexdigest())
+
+
+class CachedResponseMixin:
+    # caches the body of GET responses per url. Each entry depends on one
+    # user (get_cache_user_id) and is dropped when that user's version is
+    # bumped by the signals in api.signals. Clients revalidate with
+    # If-None-Match and get a 304 without any serialization or query. The
+    # Link header of a capped legacy list (api.pagination) is kept along.
+    cache_timeout = None  # seconds, RESPONSE_CACHE_TIMEOUT when None
+
+    def get_cache_user_id(self):
+        # the user the response is built from, found before building it
+        # (None: not cached)
+        raise NotImplementedError
+
+    async def aget_cache_user_id(self):
+        return await sync_to_async(self.get_cache_user_id)()
+
+    def get_cache_key(self, request):
+        return f"resp:{type(self).__name__}:{request.get_full_path()}"
+
+    def get_cache_timeout(self):
+        return self.cache_timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    def revalidate(self, request, response, etag, link=None):
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        if link:
+            response['Link'] = link
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def get(self, request, *args, **kwargs):
+        cache = response_cache()
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None and get_version(entry[0]) == entry[1]:
+            user_id, version, etag, data, link = entry
+            response = Response(data)
+        else:
+            user_id = self.get_cache_user_id()
+            # the version from before the query: a write landing while the
+            # response is built bumps it, the entry is then never served
+            version = get_version(user_id) if user_id is not None else None
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK or user_id is None:
+                return response
+            etag = make_etag(response.data)
+            link = response.get('Link')
+            cache.set(key, (user_id, version, etag, response.data, link), self.get_cache_timeout())
+        return self.revalidate(request, response, etag, link)
+
+
+class AsyncCachedResponseMixin(CachedResponseMixin):
+    # the same for the async views (api.async_views), through the async
+    # cache api
+
+    async def get(self, request, *args, **kwargs):
+        cache = response_cache()
+        key = self.get_cache_key(request)
+        entry = await cache.aget(key)
+        if entry is not None and await aget_version(entry[0]) == entry[1]:
+            user_id, version, etag, data, link = entry
+            response = Response(data)
+        else:
+            user_id = await self.aget_cache_user_id()
+            version = await aget_version(user_id) if user_id is not None else None
+            response = await super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK or user_id is None:
+                return response
+            etag = make_etag(response.data)
+            link = response.get('Link')
+            await cache.aset(key, (user_id, version, etag, response.data, link), self.get_cache_timeout())
+        return self.revalidate(request, response, etag, link)
@@ -0,0 +1,313 @@
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .authentication import request_user
+
+# per route timings of the requests served by this process: wall time,
+# time in the database, number of queries, time in the serializers and
+# response size. Kept as histograms per route (since the start of the
+# process) plus a ring buffer of the last requests, read by the staff views
+# api/metrics/ (json) and api/metrics/prometheus (text format). Like the
+# notifications it's per process, scrape every worker.
+#
+# A staff request with the X-Profile header (or one in
+# INSTRUMENTATION_PROFILE_RATE) also runs under cProfile when
+# INSTRUMENTATION_PROFILING is on; its stats
+# are kept under the id sent back in X-Profile-Id, see api/metrics/profiles/<id>/.
+
+# upper bounds (seconds) of the wall time buckets, like a prometheus histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILES_KEPT = 20
+PROFILE_LINES = 40
+
+current = ContextVar('request_record', default=None)
+
+
+class RequestRecord:
+    __slots__ = ('id', 'route', 'method', 'status', 'at', 'wall', 'db', 'queries', 'serializer', 'size',
+                 'profile', '_serializing')
+
+    def __init__(self, method):
+        self.id = None
+        self.route = None
+        self.method = method
+        self.status = None
+        self.at = time.time()
+        self.wall = self.db = self.serializer = 0.0
+        self.queries = self.size = 0
+        self.profile = None
+        self._serializing = False
+
+    def as_dict(self):
+        return {
+            "id": self.id, "route": self.route, "method": self.method, "status": self.status, "at": self.at,
+            "wall_ms": round(self.wall * 1000, 3), "db_ms": round(self.db * 1000, 3), "queries": self.queries,
+            "serializer_ms": round(self.serializer * 1000, 3), "size": self.size,
+            "profiled": self.profile is not None,
+        }
+
+
+class RouteStats:
+    __slots__ = ('count', 'buckets', 'wall', 'db', 'queries', 'serializer', 'size', 'statuses')
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(BUCKETS)
+        self.wall = self.db = self.serializer = 0.0
+        self.queries = self.size = 0
+        self.statuses = {}
+
+    def add(self, record):
+        self.count += 1
+        for n, bound in enumerate(BUCKETS):
+            if record.wall <= bound:
+                self.buckets[n] += 1
+                break
+        self.wall += record.wall
+        self.db += record.db
+        self.queries += record.queries
+        self.serializer += record.serializer
+        self.size += record.size
+        self.statuses[record.status] = self.statuses.get(record.status, 0) + 1
+
+    def quantile(self, q):
+        # estimated like prometheus' histogram_quantile: linear inside the
+        # bucket holding the rank, the last finite bound past it
+        rank = q * self.count
+        seen = 0
+        for n, (bound, count) in enumerate(zip(BUCKETS, self.buckets)):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return BUCKETS[-2]
+                lower = BUCKETS[n - 1] if n else 0.0
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+    def as_dict(self):
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "p50_ms": round(self.quantile(0.50) * 1000, 2),
+            "p95_ms": round(self.quantile(0.95) * 1000, 2),
+            "p99_ms": round(self.quantile(0.99) * 1000, 2),
+            "mean_ms": round(self.wall / count * 1000, 2),
+            "db_mean_ms": round(self.db / count * 1000, 2),
+            "queries_mean": round(self.queries / count, 2),
+            "serializer_mean_ms": round(self.serializer / count * 1000, 2),
+            "size_mean": round(self.size / count),
+            "statuses": {str(status): n for status, n in sorted(self.statuses.items())},
+        }
+
+
+class Metrics:
+
+    def __init__(self, size=1000):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.recent = deque(maxlen=size)
+        self.routes = {}  # (route, method) -> RouteStats
+        self.profiles = deque(maxlen=PROFILES_KEPT)  # (id, stats text)
+
+    def add(self, record):
+        with self._lock:
+            record.id = next(self._ids)
+            self.recent.append(record)
+            stats = self.routes.get((record.route, record.method))
+            if stats is None:
+                stats = self.routes[(record.route, record.method)] = RouteStats()
+            stats.add(record)
+            if record.profile is not None:
+                self.profiles.append((record.id, record.profile))
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.routes.clear()
+            self.profiles.clear()
+
+    def profile(self, record_id):
+        with self._lock:
+            return next((text for n, text in self.profiles if n == record_id), None)
+
+    def snapshot(self, recent=50):
+        with self._lock:
+            routes = [(route, method, stats.as_dict()) for (route, method), stats in sorted(self.routes.items())]
+            last = [record.as_dict() for record in list(self.recent)[-recent:]] if recent else []
+            profiles = [n for n, _ in self.profiles]
+        return {
+            "routes": [{"route": route, "method": method, **stats} for route, method, stats in routes],
+            "recent": last,
+            "profiles": profiles,
+        }
+
+    def prometheus(self):
+        with self._lock:
+            routes = sorted(self.routes.items())
+            lines = [
+                "# HELP avrid_http_request_duration_seconds Wall time of the requests.",
+                "# TYPE avrid_http_request_duration_seconds histogram",
+            ]
+            for (route, method), stats in routes:
+                labels = f'route="{escape(route)}",method="{method}"'
+                cumulated = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulated += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f'avrid_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulated}')
+                lines.append(f"avrid_http_request_duration_seconds_sum{{{labels}}} {stats.wall:.6f}")
+                lines.append(f"avrid_http_request_duration_seconds_count{{{labels}}} {stats.count}")
+            for name, help_text, value in (
+                ("avrid_http_requests_total", "Requests by status.", None),
+                ("avrid_http_request_db_seconds_total", "Time spent in the database.", 'db'),
+                ("avrid_http_request_queries_total", "SQL queries run.", 'queries'),
+                ("avrid_http_request_serializer_seconds_total", "Time spent in the serializers.", 'serializer'),
+                ("avrid_http_response_bytes_total", "Size of the response bodies.", 'size'),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (route, method), stats in routes:
+                    labels = f'route="{escape(route)}",method="{method}"'
+                    if value is None:
+                        for status, n in sorted(stats.statuses.items()):
+                            lines.append(f'{name}{{{labels},status="{status}"}} {n}')
+                    else:
+                        lines.append(f"{name}{{{labels}}} {getattr(stats, value)}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics(settings.INSTRUMENTATION_BUFFER)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # every connection reports to the request running (if any), whatever
+    # thread it lives in: the record follows the context into sync_to_async
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def time_query(execute, sql, params, many, context):
+    record = current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.db += time.perf_counter() - began
+        record.queries += 1
+
+
+@contextmanager
+def serializing():
+    # time spent building the representation, nested serializers are
+    # counted once in the outermost
+    record = current.get()
+    if record is None or record._serializing:
+        yield
+        return
+    record._serializing = True
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.serializer += time.perf_counter() - began
+        record._serializing = False
+
+
+class TimedSerializerMixin:
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.INSTRUMENTATION:
+            return self.get_response(request)
+        record = RequestRecord(request.method)
+        token = current.set(record)
+        profiler = cProfile.Profile() if self.profiled(request) else None
+        began = time.perf_counter()
+        try:
+            if profiler is not None:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            record.wall = time.perf_counter() - began
+            current.reset(token)
+        if profiler is not None:
+            record.profile = profile_text(profiler)
+        return self.done(request, response, record)
+
+    async def __acall__(self, request):
+        # cProfile only sees one thread, the async requests aren't profiled
+        if not settings.INSTRUMENTATION:
+            return await self.get_response(request)
+        record = RequestRecord(request.method)
+        token = current.set(record)
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            record.wall = time.perf_counter() - began
+            current.reset(token)
+        return self.done(request, response, record)
+
+    def profiled(self, request):
+        if not settings.INSTRUMENTATION_PROFILING:
+            return False
+        if random.random() < settings.INSTRUMENTATION_PROFILE_RATE:
+            return True
+        if not request.META.get(PROFILE_HEADER):
+            return False
+        # the header slows the request down a lot, staff only
+        user = request_user(request)
+        return user is not None and user.is_staff
+
+    def done(self, request, response, record):
+        match = request.resolver_match
+        record.route = match.route if match is not None else '<unmatched>'
+        record.status = response.status_code
+        if not response.streaming:
+            record.size = len(response.content)
+        metrics.add(record)
+        if record.profile is not None:
+            response['X-Profile-Id'] = str(record.id)
+        return response
+
+
+def profile_text(profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return out.getvalue()
@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from history.models import archive_trips
+from posts.models import posts
+
+
+class Command(BaseCommand):
+    help = "Move the finished trips and their reservations to the archive tables in batches, meant to run from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.ARCHIVE_TRIPS_AFTER_DAYS,
+                            help="archive the trips arrived more than this many days ago")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days must be positive and --batch-size at least 1")
+        batch_size = options["batch_size"]
+        before = timezone.now() - timedelta(days=options["days"])
+        trips = visits = 0
+        while True:
+            ids = list(
+                posts.objects.filter(arrival_date__lt=before)
+                .order_by("id").values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                moved = archive_trips(ids, before)
+            trips += moved[0]
+            visits += moved[1]
+        self.stdout.write(self.style.SUCCESS(f"Archived {trips} trips and {visits} reservations"))
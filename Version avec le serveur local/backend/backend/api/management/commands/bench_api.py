@@ -0,0 +1,274 @@
+import json
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import quote, urlencode
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from api.authentication import tokens_for_user
+from api.seeding import Seeder, scratch_database
+from history.models import history
+from posts.models import posts
+from users.models import profile
+
+# latency of the real routes of backend/urls.py, called through the whole
+# middleware / auth / view / serializer stack by `--concurrency` clients
+# (threads, like a threaded wsgi worker; the http server and the network are
+# not measured). It runs on a throwaway database (test_<name>, or a temp file
+# for sqlite) seeded with a synthetic dataset, never on the real one.
+#
+#   manage.py bench_api --save-baseline api/bench_baseline.json
+#   manage.py bench_api --baseline api/bench_baseline.json   # exits 1 on a regression
+
+
+def load_dataset():
+    # what the clients pick their urls and users from
+    people = profile.objects.order_by('id').values_list('id', 'username', 'type_user')
+    booked = {}
+    for visitor, title in history.objects.values_list('visitor_id', 'post__title'):
+        booked.setdefault(visitor, []).append(title)
+    return {
+        "drivers": [(pk, username) for pk, username, kind in people if kind == profile.conducteur],
+        "riders": [(pk, username) for pk, username, kind in people if kind != profile.conducteur],
+        "routes": list(posts.objects.values_list('depart_place', 'arrival_place')),
+        "points": list(posts.objects.values_list('depart_lat', 'depart_lon', 'arrival_lat', 'arrival_lon')),
+        "trips": list(posts.objects.values_list('title', flat=True)),
+        "booked": booked,
+    }
+
+
+def search(rng, data, **filters):
+    # the routes are weighted like the trips, busy lines are searched more
+    depart, arrival = rng.choice(data["routes"])
+    return "/api/posts/search/?" + urlencode({"depart": depart, "arrival": arrival, **filters})
+
+
+def search_window(rng, data):
+    # departures within a day, from today to the end of the seeded ones
+    after = timezone.now() + timedelta(hours=rng.randrange(24 * 30))
+    return search(rng, data, depart_after=after.isoformat(), depart_before=(after + timedelta(days=1)).isoformat())
+
+
+def search_near(rng, data):
+    # around the ends of a seeded trip, like a rider's map pins
+    depart_lat, depart_lon, arrival_lat, arrival_lon = rng.choice(data["points"])
+    return "/api/posts/search/?" + urlencode({
+        "depart_lat": depart_lat, "depart_lon": depart_lon, "arrival_lat": arrival_lat, "arrival_lon": arrival_lon,
+        "radius": 10,
+    })
+
+
+def find(rng, data):
+    depart, arrival = rng.choice(data["routes"])
+    return f"/api/posts/find/{quote(depart)}/{quote(arrival)}/"
+
+
+def booked(rng, data, caller):
+    # a trip the caller holds a place on (from the seed), or any trip
+    titles = data["booked"].get(caller)
+    if titles:
+        return titles.pop(rng.randrange(len(titles)))
+    return rng.choice(data["trips"])
+
+
+# endpoint -> (method, who calls it, path built from a random generator, the
+# dataset and the calling user's id)
+ENDPOINTS = {
+    "search": ("get", "riders", lambda rng, data, caller: search(rng, data)),
+    "search_filters": ("get", "riders", lambda rng, data, caller: search(
+        rng, data, price_max=2000, seats=2, expand="author",
+    )),
+    "search_partial": ("get", "riders", lambda rng, data, caller: search(rng, data, partial="true")),
+    "search_window": ("get", "riders", lambda rng, data, caller: search_window(rng, data)),
+    "search_near": ("get", "riders", lambda rng, data, caller: search_near(rng, data)),
+    "find": ("get", "riders", lambda rng, data, caller: find(rng, data)),
+    "places": ("get", "riders", lambda rng, data, caller: "/api/posts/places/?" + urlencode(
+        {"q": rng.choice(data["routes"])[0][:3]},
+    )),
+    "profile": ("get", "riders", lambda rng, data, caller: f"/api/user/{rng.choice(data['drivers'])[1]}/"),
+    "profile_id": ("get", "riders", lambda rng, data, caller: f"/api/user/id/{rng.choice(data['drivers'])[0]}/"),
+    "comments": ("get", "riders", lambda rng, data, caller: f"/api/user/comments/{rng.choice(data['drivers'])[1]}/"),
+    "mycomments": ("get", "riders", lambda rng, data, caller: "/api/user/mycomments"),
+    "history": ("get", "riders", lambda rng, data, caller: "/api/user/history"),
+    "trajet": ("get", "drivers", lambda rng, data, caller: "/api/user/trajet"),
+    "myreservation": ("get", "drivers", lambda rng, data, caller: "/api/user/myreservation"),
+    # writes last, they change what the reads above would return. A full
+    # trip or a second reservation is a 400, counted apart from the errors
+    "reserve": ("post", "riders", lambda rng, data, caller: f"/api/posts/reservation/{rng.choice(data['trips'])}/"),
+    "cancel": ("post", "riders", lambda rng, data, caller: f"/api/posts/reservation_annule/{booked(rng, data, caller)}/"),
+}
+
+
+def percentile(values, fraction):
+    # values sorted
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_endpoint(name, data, tokens, requests=200, concurrency=4, warmup=10, seed=0):
+    # `requests` calls of the endpoint split over `concurrency` clients, each
+    # with its own users, connection and random generator
+    method, callers, build = ENDPOINTS[name]
+    callers = [pk for pk, _ in data[callers] if pk in tokens]
+    latencies, queries, statuses = [], [], {}
+    lock = threading.Lock()
+
+    def client_loop(number, count):
+        rng = random.Random(f"{seed}-{name}-{number}")
+        client = Client(raise_request_exception=False)
+        own_latencies, own_queries, own_statuses = [], [], {}
+        for n in range(warmup + count):
+            caller = rng.choice(callers)
+            path = build(rng, data, caller)
+            headers = {"Authorization": f"Bearer {tokens[caller]}"}
+            with CaptureQueriesContext(connections['default']) as captured:
+                began = time.perf_counter()
+                response = getattr(client, method)(path, headers=headers)
+                elapsed = time.perf_counter() - began
+            if n < warmup:
+                continue
+            own_latencies.append(elapsed)
+            own_queries.append(len(captured))
+            own_statuses[response.status_code] = own_statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(own_latencies)
+            queries.extend(own_queries)
+            for code, count in own_statuses.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    shares = [requests // concurrency + (n < requests % concurrency) for n in range(concurrency)]
+    began = time.perf_counter()
+    if concurrency == 1:
+        client_loop(0, requests)  # on this thread and its connection (and its transaction, in the tests)
+    else:
+        def run(number, count):
+            try:
+                client_loop(number, count)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(n, count)) for n, count in enumerate(shares)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    # the warmup calls are in the wall time, close enough for a throughput
+    wall = time.perf_counter() - began
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "p50": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99": round(percentile(latencies, 0.99) * 1000, 2),
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "queries": round(sum(queries) / len(queries), 2) if queries else 0.0,
+        "client_errors": sum(count for code, count in statuses.items() if 400 <= code < 500),
+        "errors": sum(count for code, count in statuses.items() if code >= 500),
+    }
+
+
+def compare(results, baseline, tolerance=0.3):
+    # the regressions of results against a saved baseline: slower p95 than
+    # the tolerance allows, more queries per request, or new server errors
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+        if result["p95"] > before["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95']}ms -> {result['p95']}ms")
+        if result["queries"] > before["queries"] + 0.5:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries per request")
+        if result["errors"] > before.get("errors", 0):
+            regressions.append(f"{name}: {result['errors']} server errors")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = "Benchmark the api endpoints (latency percentiles, throughput, queries per request) on a synthetic dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=2000)
+        parser.add_argument("--reservations", type=int, default=1500)
+        parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+        parser.add_argument("--concurrency", type=int, default=4, help="clients calling an endpoint at once")
+        parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per client first")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--endpoint", choices=list(ENDPOINTS), action="append",
+                            help="run only this endpoint (repeatable)")
+        parser.add_argument("--baseline", help="json file of a previous run to compare with")
+        parser.add_argument("--tolerance", type=float, default=0.3, help="p95 increase allowed over the baseline")
+        parser.add_argument("--save-baseline", help="write the results to this json file")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("--concurrency and --requests must be at least 1")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        dataset = {key: options[key] for key in ("users", "posts", "comments", "reservations", "seed")}
+        run = {key: options[key] for key in ("requests", "concurrency", "warmup")}
+        if baseline is not None and (baseline.get("dataset"), baseline.get("run")) != (dataset, run):
+            self.stderr.write("the baseline was measured with other options, the comparison is rough")
+
+        with scratch_database():
+            results = self.bench(dataset, options)
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as f:
+                json.dump({"dataset": dataset, "run": run, "endpoints": results}, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(f"baseline written to {options['save_baseline']}")
+        if baseline is not None:
+            regressions = compare(results, baseline, options["tolerance"])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"no regression against {options['baseline']}"))
+
+    def bench(self, dataset, options):
+        began = time.perf_counter()
+        stats = Seeder(dataset["seed"], prefix="bench").run(
+            dataset["users"], dataset["posts"], dataset["reservations"], dataset["comments"],
+        )
+        data = load_dataset()
+        # a few hundred of the users are the callers, each with a token
+        rng = random.Random(dataset["seed"])
+        callers = rng.sample(data["drivers"], min(len(data["drivers"]), 50))
+        callers += rng.sample(data["riders"], min(len(data["riders"]), 200))
+        users = profile.objects.in_bulk([pk for pk, _ in callers])
+        tokens = {pk: str(tokens_for_user(user).access_token) for pk, user in users.items()}
+        self.stdout.write(
+            f"{stats['users']} users, {stats['posts']} posts, {stats['comments']} comments, "
+            f"{stats['reservations']} reservations seeded in {time.perf_counter() - began:.1f}s on {connection.vendor}"
+        )
+        self.stdout.write(
+            f"{options['requests']} requests per endpoint, {options['concurrency']} clients, "
+            f"{options['warmup']} warmup each"
+        )
+        self.stdout.write(
+            f"{'endpoint':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'queries':>9}{'4xx':>6}{'5xx':>6}"
+        )
+        results = {}
+        logging.getLogger('django.request').setLevel(logging.ERROR)  # one warning per 4xx otherwise
+        for name in options["endpoint"] or list(ENDPOINTS):
+            result = results[name] = run_endpoint(
+                name, data, tokens, options["requests"], options["concurrency"], options["warmup"], options["seed"],
+            )
+            self.stdout.write(
+                f"{name:<16}{result['p50']:>7.1f}ms{result['p95']:>7.1f}ms{result['p99']:>7.1f}ms"
+                f"{result['rps']:>9.0f}{result['queries']:>9.1f}{result['client_errors']:>6}{result['errors']:>6}"
+            )
+        return results
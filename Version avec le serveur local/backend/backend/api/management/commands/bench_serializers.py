@@ -0,0 +1,96 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from api.renderers import ORJSONRenderer
+from api.seeding import Seeder, scratch_database
+from api.serializers import (
+    CommentsSerializer, FlatCommentsSerializer, FlatHistorySerializer, FlatPostsSerializer, HistorySerializer,
+    PostsSerializer,
+)
+from history.models import history
+from posts.models import posts
+from users.models import comments_rating
+
+# time per 1000 rows of the list endpoints' json, before (model instances
+# through the ModelSerializer fields, stdlib json) and after (values_list
+# rows through the flat serializers, orjson), split in fetch / serialize /
+# render. Best of --repeat runs, on a throwaway seeded database.
+
+# name -> (queryset, serializer, flat serializer, ?expand=)
+CASES = {
+    "posts": (lambda: posts.objects.order_by('depart_date', 'id'), PostsSerializer, FlatPostsSerializer, ()),
+    "posts+author": (
+        lambda: posts.objects.order_by('depart_date', 'id'), PostsSerializer, FlatPostsSerializer, ('author',),
+    ),
+    "history": (lambda: history.objects.order_by('-id'), HistorySerializer, FlatHistorySerializer, ()),
+    "comments": (lambda: comments_rating.objects.order_by('-id'), CommentsSerializer, FlatCommentsSerializer, ()),
+}
+
+
+def timed(function):
+    began = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - began
+
+
+def before(queryset, serializer_class, context, rows):
+    queryset = serializer_class.setup_eager_loading(queryset, expand=context['expand'])
+    instances, fetch = timed(lambda: list(queryset[:rows]))
+    data, serialize = timed(lambda: serializer_class(instances, many=True, context=context).data)
+    body, render = timed(lambda: JSONRenderer().render(data))
+    return body, (fetch, serialize, render)
+
+
+def after(queryset, flat_class, context, rows):
+    flat = flat_class(context)
+    values, fetch = timed(lambda: list(flat.setup(queryset)[:rows]))
+    data, serialize = timed(lambda: flat.to_representation(values))
+    body, render = timed(lambda: ORJSONRenderer().render(data))
+    return body, (fetch, serialize, render)
+
+
+class Command(BaseCommand):
+    help = "Time the json of the list endpoints per 1000 rows, model serializers + json vs flat serializers + orjson"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5, help="runs per case, the best is kept")
+        parser.add_argument("--case", choices=list(CASES), action="append", help="run only this case (repeatable)")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        if rows < 1 or options["repeat"] < 1:
+            raise CommandError("--rows and --repeat must be at least 1")
+        with scratch_database():
+            Seeder(prefix="bench").run(users=max(rows // 5, 50), trips=rows, reservations=rows * 3, comments=rows)
+            self.stdout.write(f"ms per 1000 rows ({rows} rows, best of {options['repeat']})")
+            self.stdout.write(
+                f"{'case':<14}{'':<8}{'fetch':>9}{'serialize':>11}{'render':>9}{'total':>9}{'speedup':>9}"
+            )
+            for name in options["case"] or list(CASES):
+                self.run_case(name, rows, options["repeat"])
+
+    def run_case(self, name, rows, repeat):
+        queryset, serializer_class, flat_class, expand = CASES[name]
+        context = {'expand': expand}
+        results = {}
+        for label, run, serializer in (("before", before, serializer_class), ("after", after, flat_class)):
+            body = None
+            best = None
+            for _ in range(repeat):
+                body, times = run(queryset(), serializer, context, rows)
+                best = times if best is None else tuple(map(min, best, times))
+            results[label] = (body, best)
+        if json.loads(results["before"][0]) != json.loads(results["after"][0]):
+            raise CommandError(f"{name}: the flat serializer doesn't give the same json")
+        count = len(json.loads(results["after"][0]))
+        scale = 1000 / count * 1000 if count else 0  # seconds -> ms per 1000 rows
+        totals = {label: sum(times) for label, (_, times) in results.items()}
+        for label, (_, times) in results.items():
+            speedup = f"{totals['before'] / totals['after']:>8.1f}x" if label == "after" and totals["after"] else ""
+            self.stdout.write(
+                f"{name if label == 'before' else '':<14}{label:<8}"
+                + "".join(f"{value * scale:>{width}.1f}" for value, width in zip(times, (9, 11, 9)))
+                + f"{totals[label] * scale:>9.1f}{speedup}"
+            )
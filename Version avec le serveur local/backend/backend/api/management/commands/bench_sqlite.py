@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+
+# each run gets its own copy of a freshly migrated and seeded database and
+# N processes doing a mix of trip searches (reads) and reservations /
+# comments (writes), the same queries as the views. Django is set up in
+# every child with SQLITE_TUNING off ("default") or on ("tuned").
+PROFILES = {'default': 'False', 'tuned': 'True'}
+DRIVERS = 50
+RIDERS = 500
+POSTS = 200
+PLACES = [("Alger", "Oran"), ("Oran", "Alger"), ("Alger", "Blida"), ("Setif", "Alger")]
+
+
+def setup_django(path, tuned):
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    os.environ['SQLITE_TUNING'] = tuned
+    os.environ['IMAGE_WORKERS'] = '0'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+
+def prepare(path):
+    setup_django(path, 'False')
+    from datetime import timedelta
+    from django.core.management import call_command
+    from django.utils import timezone
+    from posts.models import posts
+    from users.models import profile
+    call_command('migrate', verbosity=0)
+    users = profile.objects.bulk_create(
+        profile(email=f"bench{n}@example.com", username=f"bench{n}") for n in range(DRIVERS + RIDERS)
+    )
+    tomorrow = timezone.now() + timedelta(days=1)
+    for n in range(POSTS):
+        depart, arrival = PLACES[n % len(PLACES)]
+        posts.objects.create(
+            title=f"bench-{n}", author_post=users[n % DRIVERS],
+            depart_date=tomorrow, arrival_date=tomorrow + timedelta(hours=2),
+            depart_place=depart, arrival_place=arrival, number_of_places=4,
+        )
+
+
+def worker(path, tuned, seconds, write_ratio, start, results, seed):
+    setup_django(path, tuned)
+    from django.db import OperationalError, connection, transaction
+    from django.utils import timezone
+    from history.models import history
+    from posts.models import normalize_place, posts
+    from users.models import comments_rating, profile
+
+    rng = random.Random(seed)
+    user_ids = list(profile.objects.order_by('id').values_list('id', flat=True))
+    drivers, riders = user_ids[:DRIVERS], user_ids[DRIVERS:]
+    post_ids = list(posts.objects.values_list('id', flat=True))
+
+    def read():
+        depart, arrival = rng.choice(PLACES)
+        list(
+            posts.objects.filter(
+                depart_key=normalize_place(depart), arrival_key=normalize_place(arrival), reserved=False,
+                depart_date__gte=timezone.now(),
+            ).select_related('author_post').order_by('depart_date', 'id')[:20]
+        )
+
+    def write():
+        if rng.random() < 0.7:
+            post = posts.objects.get(pk=rng.choice(post_ids))
+            rider = profile(pk=rng.choice(riders))
+            if history.objects.reserve(post, rider) is None:
+                history.objects.cancel(post, rider)
+        else:
+            with transaction.atomic():
+                comments_rating.objects.create(
+                    title="bench", rating=rng.randint(1, 5), comment="bench",
+                    author_comment_id=rng.choice(riders), received_user_id=rng.choice(drivers),
+                )
+
+    reads = writes = locked = 0
+    latencies = []
+    start.wait()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        began = time.monotonic()
+        try:
+            if rng.random() < write_ratio:
+                write()
+                writes += 1
+                latencies.append(time.monotonic() - began)
+            else:
+                read()
+                reads += 1
+        except OperationalError:  # database is locked
+            locked += 1
+    connection.close()
+    results.put((reads, writes, locked, latencies))
+
+
+class Command(BaseCommand):
+    help = "Compare the default and tuned SQLite settings under several processes reading and writing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="share of writes among the operations")
+        parser.add_argument("--profile", choices=sorted(PROFILES), action="append",
+                            help="run only this profile (repeatable)")
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        directory = tempfile.mkdtemp(prefix="bench-sqlite-")
+        try:
+            template = os.path.join(directory, "template.sqlite3")
+            process = context.Process(target=prepare, args=(template,))
+            process.start()
+            process.join()
+            if process.exitcode:
+                raise RuntimeError("could not prepare the benchmark database")
+
+            self.stdout.write(
+                f"{options['processes']} processes, {options['seconds']:g}s, "
+                f"{options['write_ratio']:.0%} writes"
+            )
+            self.stdout.write(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'locked':>8}{'p95 write':>11}")
+            for name in options["profile"] or sorted(PROFILES):
+                path = os.path.join(directory, f"{name}.sqlite3")
+                shutil.copyfile(template, path)
+                self.stdout.write(self.row(name, self.run(context, path, PROFILES[name], options)))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run(self, context, path, tuned, options):
+        start = context.Barrier(options["processes"] + 1)  # the clock starts once every child is set up
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(
+                path, tuned, options["seconds"], options["write_ratio"], start, results, seed,
+            ))
+            for seed in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        start.wait()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return totals, options["seconds"]
+
+    def row(self, name, run):
+        totals, seconds = run
+        reads = sum(total[0] for total in totals)
+        writes = sum(total[1] for total in totals)
+        locked = sum(total[2] for total in totals)
+        latencies = sorted(latency for total in totals for latency in total[3])
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        return f"{name:<10}{reads / seconds:>10.0f}{writes / seconds:>10.0f}{locked:>8}{p95:>9.1f}ms"
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.seeding import BATCH_SIZE, Seeder
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, trips, reservations and comments (deterministic for a given --seed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--drivers", type=float, default=0.2, help="share of drivers among the users")
+        parser.add_argument("--posts", type=int, default=50000)
+        parser.add_argument("--reservations", type=int, default=80000, help="roughly, the trips are filled at random")
+        parser.add_argument("--comments", type=int, default=40000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="seed", help="usernames are <prefix>-<n>, titles <prefix>-<n>")
+        parser.add_argument("--password", help="password of every seeded user (hashed once), unusable by default")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seeder = Seeder(
+                options["seed"], options["prefix"], options["password"], options["batch_size"],
+                log=lambda message: self.stdout.write(f"  {message}") if options["verbosity"] else None,
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        if seeder.exists():
+            raise CommandError(f"users {options['prefix']}-* already exist, pick another --prefix")
+        if min(options["users"], options["posts"]) < 1 or not 0 < options["drivers"] < 1:
+            raise CommandError("at least one user and one post, and --drivers between 0 and 1")
+        stats = seeder.run(
+            options["users"], options["posts"], options["reservations"], options["comments"], options["drivers"],
+        )
+        if options["verbosity"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"{stats['users']} users ({stats['drivers']} drivers), {stats['posts']} posts, "
+                f"{stats['reservations']} reservations, {stats['comments']} comments"
+            ))
@@ -0,0 +1,161 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat as stat_module
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.db.models import Q
+from django.views.decorators.http import require_safe
+from users.images import is_immutable, source_name
+from users.models import profile
+from .authentication import request_user
+
+# serves MEDIA_ROOT outside of DEBUG too. Processed pictures are named after
+# their content (users.images) so devices keep them for a year without
+# asking again; anything else is revalidated against its ETag. Ranges and
+# conditional requests are answered here, unless MEDIA_SENDFILE hands the
+# file to the front server once the checks are done. The private prefixes
+# (permis / id scans) are only served to their owner and the staff.
+IMMUTABLE = 'max-age=31536000, immutable'
+REVALIDATE = 'max-age=0, must-revalidate'
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def media_etag(path, stat):
+    if is_immutable(path):
+        return quote_etag(posixpath.splitext(posixpath.basename(path))[0])
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def is_private(path):
+    return path.startswith(tuple(getattr(settings, 'MEDIA_PRIVATE_PREFIXES', ())))
+
+
+def cache_control(path):
+    return ('private, ' if is_private(path) else 'public, ') + (IMMUTABLE if is_immutable(path) else REVALIDATE)
+
+
+def may_read(request, path):
+    if not is_private(path):
+        return True
+    user = request_user(request)
+    if user is None:
+        return False
+    if user.is_staff:
+        return True
+    name = source_name(path)  # a thumbnail goes with its image
+    return profile.objects.filter(Q(user_pic=name) | Q(ppermis_ic=name), pk=user.pk).exists()
+
+
+def parse_range(header, size):
+    # (start, end) of a single byte range, None to send the whole file
+    # (no range, several ranges or a malformed one), ValueError when it
+    # can't be satisfied
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-n, the last n bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def range_applies(request, etag, last_modified):
+    # If-Range: the range is only valid for the version the client has
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_range(fullpath, start, length):
+    with open(fullpath, 'rb') as source:
+        source.seek(start)
+        while length > 0:
+            chunk = source.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload(path, fullpath, content_type):
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', None)
+    if not sendfile:
+        return None
+    response = HttpResponse(content_type=content_type)
+    if sendfile == 'x-accel-redirect':
+        # nginx: an `internal` location aliased to MEDIA_ROOT
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(path)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+def file_response(request, fullpath, stat, etag, last_modified, content_type):
+    byte_range = None
+    if 'Range' in request.headers and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{stat.st_size}"
+            return response
+    if byte_range is None:
+        return FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        read_range(fullpath, start, end - start + 1), status=206, content_type=content_type,
+    )
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Media not found")
+    # the checks run on the resolved name, `a//b`, `./` or `x/../` can't
+    # dodge the private prefixes
+    path = os.path.relpath(fullpath, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    if not may_read(request, path):
+        raise Http404("Media not found")  # the same answer as a missing file
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404("Media not found")
+    if not stat_module.S_ISREG(stat.st_mode):
+        raise Http404("Media not found")
+
+    etag = media_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    response = (
+        get_conditional_response(request, etag=etag, last_modified=last_modified)  # 304 / 412
+        or offload(path, fullpath, content_type)
+        or file_response(request, fullpath, stat, etag, last_modified, content_type)
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control(path)
+    response['Accept-Ranges'] = 'bytes'
+    return response
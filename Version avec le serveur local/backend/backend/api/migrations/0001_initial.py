@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0005_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='token_profile',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('users.profile',),
+        ),
+    ]
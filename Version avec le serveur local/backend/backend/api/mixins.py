@@ -0,0 +1,41 @@
+from rest_framework.response import Response
+
+
+class EagerLoadingMixin:
+    # applies the select_related / prefetch_related plan declared by the
+    # serializer so nested fields never fire one query per row
+    expandable = ()  # relations the client may inline with ?expand=a,b
+
+    def get_expand(self):
+        requested = self.request.query_params.get('expand', '').split(',')
+        return tuple(name for name in requested if name in self.expandable)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        setup = getattr(serializer_class, 'setup_eager_loading', None)
+        if setup is not None:
+            queryset = setup(queryset, expand=self.get_expand())
+        return queryset
+
+
+class FlatListMixin:
+    # list() through a read only flat serializer (api.serializers): the rows
+    # come from values_list, the writes keep serializer_class
+    flat_serializer_class = None
+
+    def get_flat_serializer(self):
+        return self.flat_serializer_class(self.get_serializer_context())
+
+    def list(self, request, *args, **kwargs):
+        flat = self.get_flat_serializer()
+        queryset = flat.setup(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(flat.to_representation(page))
+        return Response(flat.to_representation(queryset))
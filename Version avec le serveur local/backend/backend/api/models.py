@@ -2,5 +2,11 @@ from django.db import models
 from users.models import profile
 
 
-
-
+class token_profile(profile):
+    # profile rebuilt from the JWT claims by api.authentication, only the
+    # fields carried by the token are set so it must never be written back
+    class Meta:
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        raise RuntimeError("token_profile is built from token claims, load the profile before saving it")
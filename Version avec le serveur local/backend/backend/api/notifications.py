@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import ClaimsJWTAuthentication, is_active
+
+# pushes reservation / cancellation / comment events (sent by api.signals
+# after the commit) to the users they concern, over a websocket
+# (/ws/notifications/, see backend.asgi) or server sent events
+# (api/async/user/events). The fan-out is in process: a client gets the
+# events of writes made by the worker it is connected to, so run the
+# websocket clients and the writes on the same uvicorn process, or keep the
+# app's slow polling as a fallback.
+WEBSOCKET_PATH = '/ws/notifications/'
+QUEUE_SIZE = 100  # events kept for a slow client, the oldest are dropped
+
+
+class Subscription:
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def push(self, event):
+        # called from any thread
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # the loop of this client is gone
+            self.broker.unsubscribe(self)
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def listening(self, user_id=None):
+        # lets the signals skip building events nobody would get
+        with self._lock:
+            return bool(self._subscriptions) if user_id is None else user_id in self._subscriptions
+
+    def event(self, kind, **data):
+        return {"id": next(self._ids), "type": kind, "at": timezone.now().isoformat(), **data}
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+
+broker = Broker()
+
+
+def authenticate_token(raw_token):
+    # user id of a valid access token of an active user, None otherwise
+    authentication = ClaimsJWTAuthentication()
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None or not is_active(user_id):
+        return None
+    return user_id
+
+
+def scope_token(scope):
+    # ?token=<access> (what a browser or react native WebSocket can send) or
+    # an Authorization: Bearer header
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization' and value.lower().startswith(b'bearer '):
+            return value[7:].decode()
+    tokens = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    return tokens[0] if tokens else None
+
+
+async def websocket_application(scope, receive, send):
+    # raw ASGI websocket: accept, then forward the user's events as json
+    # text frames until the client goes away. Incoming frames are ignored.
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope['path'] != WEBSOCKET_PATH:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    token = scope_token(scope)
+    user_id = await sync_to_async(authenticate_token)(token) if token else None
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    subscription = broker.subscribe(user_id)  # before accepting, nothing is missed
+    await send({'type': 'websocket.accept'})
+    incoming = asyncio.ensure_future(receive())
+    outgoing = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({incoming, outgoing}, return_when=asyncio.FIRST_COMPLETED)
+            if incoming in done:
+                if incoming.result()['type'] == 'websocket.disconnect':
+                    break
+                incoming = asyncio.ensure_future(receive())
+            if outgoing in done:
+                try:
+                    await send({'type': 'websocket.send', 'text': json.dumps(outgoing.result())})
+                except OSError:  # closed under our feet
+                    break
+                outgoing = asyncio.ensure_future(subscription.get())
+    finally:
+        subscription.close()
+        incoming.cancel()
+        outgoing.cancel()
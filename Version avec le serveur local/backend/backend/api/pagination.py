@@ -0,0 +1,43 @@
+from django.conf import settings
+from rest_framework import pagination
+from rest_framework.response import Response
+
+
+class CursorPagination(pagination.CursorPagination):
+    # keyset pagination for every list endpoint. The view picks its stable
+    # ordering key with cursor_ordering (backed by an index)
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering is None:
+            return super().get_ordering(request, queryset, view)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # routes already used by the released mobile app (legacy_list) keep
+        # returning every row as a bare list until the client asks for a
+        # page. LEGACY_LIST_MAX_ROWS cuts them to that many rows, the rest
+        # following as cursor pages from the Link header (breaking: the
+        # released app doesn't read it)
+        self.legacy = getattr(view, 'legacy_list', False) and not (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+        if self.legacy and settings.LEGACY_LIST_MAX_ROWS is None:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_page_size(self, request):
+        if self.legacy:
+            return settings.LEGACY_LIST_MAX_ROWS
+        return super().get_page_size(request)
+
+    def get_paginated_response(self, data):
+        if not self.legacy:
+            return super().get_paginated_response(data)
+        next_link = self.get_next_link()
+        return Response(data, headers={'Link': f'<{next_link}>; rel="next"'} if next_link else None)
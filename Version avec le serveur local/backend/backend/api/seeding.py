@@ -0,0 +1,281 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import accumulate
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from history.models import history
+from posts.geo import haversine_km
+from posts.models import geohash, normalize_place, posts, route_waypoints, waypoint
+from posts.places import place_index
+from users.models import comments_rating, profile, rebuild_ratings
+
+# synthetic profiles / posts / history / comments_rating at production
+# volumes (manage.py seed, bench_api). Everything is drawn from one
+# random.Random(seed): the same options give the same rows (dated from the
+# day of the run). Rows go in with
+# bulk_create, so the signals and posts.save don't run and what they keep
+# (place keys, geohashes, route waypoints, reserved places, rating totals)
+# is computed here.
+
+# (name, population in thousands, lat, lon)
+CITIES = [
+    ("Alger", 3416, 36.7538, 3.0588), ("Oran", 1454, 35.6971, -0.6308),
+    ("Constantine", 938, 36.3650, 6.6147), ("Annaba", 640, 36.9000, 7.7667),
+    ("Blida", 500, 36.4700, 2.8277), ("Batna", 320, 35.5559, 6.1741),
+    ("Setif", 290, 36.1898, 5.4108), ("Djelfa", 265, 34.6704, 3.2630),
+    ("Sidi Bel Abbes", 210, 35.1899, -0.6309), ("Biskra", 205, 34.8504, 5.7280),
+    ("Tebessa", 196, 35.4042, 8.1242), ("Chlef", 180, 36.1653, 1.3345),
+    ("Tiaret", 178, 35.3710, 1.3170), ("Béjaïa", 177, 36.7509, 5.0567),
+    ("Tlemcen", 173, 34.8783, -1.3150), ("Skikda", 160, 36.8762, 6.9092),
+    ("Mostaganem", 150, 35.9312, 0.0891), ("Tizi Ouzou", 145, 36.7169, 4.0497),
+    ("Ouargla", 133, 31.9493, 5.3250), ("Jijel", 130, 36.8206, 5.7667),
+    ("Médéa", 123, 36.2642, 2.7539), ("Ghardaïa", 93, 32.4909, 3.6736),
+    ("Bouira", 75, 36.3749, 3.9020), ("Boumerdès", 40, 36.7664, 3.4772),
+]
+SEATS = ((1, 2, 3, 4, 5, 6), (8, 17, 30, 35, 7, 3))
+# departures per hour of the day, morning and end of afternoon peaks
+HOURS = (0, 0, 0, 0, 1, 4, 9, 12, 10, 6, 5, 5, 6, 5, 5, 6, 8, 9, 6, 3, 2, 1, 1, 0)
+# most trips go well, a few drivers get most of the bad marks
+RATINGS = ((1, 2, 3, 4, 5), (3, 5, 12, 35, 45))
+BAD_RATINGS = ((1, 2, 3, 4, 5), (20, 20, 25, 20, 15))
+COMMENTS = {
+    1: "Conducteur en retard et trajet désagréable",
+    2: "Pas terrible, conduite brusque",
+    3: "Correct, sans plus",
+    4: "Bon trajet, conducteur ponctuel",
+    5: "Parfait, je recommande",
+}
+SPEED = 75  # km/h, door to door
+# departure days around today: like a real table most trips are over
+PAST_DAYS = 60
+AHEAD_DAYS = 30
+STOPS_SHARE = 0.3  # trips announcing stops, among those with cities on the way
+DETOUR = 1.15
+PRICE_PER_KM = 4  # DA per seat
+BATCH_SIZE = 5000
+MAX_PREFIX = 12  # titles are "<prefix>-<n>" in a CharField(max_length=25)
+
+
+def city_pairs():
+    # every (depart, arrival, distance, cities on the way) with a gravity
+    # weight: big cities close to each other exchange the most trips
+    pairs, weights = [], []
+    for depart in CITIES:
+        for arrival in CITIES:
+            if depart is arrival:
+                continue
+            distance = haversine_km(*depart[2:], *arrival[2:])
+            pairs.append((depart, arrival, distance, on_the_way(depart, arrival, distance)))
+            weights.append(depart[1] * arrival[1] / max(distance, 20) ** 1.5)
+    return pairs, weights
+
+
+def on_the_way(depart, arrival, distance):
+    # the cities a detour of less than DETOUR away, in the order they're passed
+    along = []
+    for city in CITIES:
+        if city is depart or city is arrival:
+            continue
+        first = haversine_km(*depart[2:], *city[2:])
+        if first + haversine_km(*city[2:], *arrival[2:]) <= distance * DETOUR:
+            along.append((first, city[0]))
+    return [name for _, name in sorted(along)]
+
+
+def around(rng, city):
+    # a meeting point in town, up to ~5 km from the center
+    _, _, lat, lon = city
+    return round(lat + rng.uniform(-0.045, 0.045), 6), round(lon + rng.uniform(-0.055, 0.055), 6)
+
+
+def spelling(rng, place):
+    # what people type: mostly the usual name, sometimes lower / upper case
+    # or without the accents, which the search keys must fold together
+    draw = rng.random()
+    if draw < 0.05:
+        return place.lower()
+    if draw < 0.08:
+        return place.upper()
+    if draw < 0.12:
+        return normalize_place(place).title()
+    return place
+
+
+@contextmanager
+def scratch_database():
+    # the benchmarks run on a throwaway database (test_<name>, or a temp
+    # file for sqlite), never on the real one
+    directory = tempfile.mkdtemp(prefix="avrid-scratch-")
+    if connection.vendor == 'sqlite':
+        # a file, the in memory test database doesn't take several connections well
+        connection.settings_dict['TEST']['NAME'] = os.path.join(directory, "scratch.sqlite3")
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+
+    def __init__(self, seed=0, prefix="seed", password=None, batch_size=BATCH_SIZE, log=None):
+        if not 0 < len(prefix) <= MAX_PREFIX:
+            raise ValueError(f"the prefix must be 1 to {MAX_PREFIX} characters")
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        # one hash for every user instead of one per row: the same password
+        # (or none, unusable) for all the seeded accounts
+        self.password = make_password(password)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def exists(self):
+        return profile.objects.filter(username__startswith=f"{self.prefix}-").exists()
+
+    def run(self, users, trips, reservations, comments, driver_share=0.2):
+        with transaction.atomic():
+            drivers, riders = self.create_users(users, driver_share)
+            self.bad_drivers = {driver for driver in drivers if self.rng.random() < 0.1}
+            stats = self.create_trips(drivers, riders, trips, reservations, comments)
+            stats["comments"] += self.create_comments(drivers, riders, comments - stats["comments"])
+            began = time.monotonic()
+            rebuild_ratings()
+            self.log(f"rating totals rebuilt in {time.monotonic() - began:.1f}s")
+        # other processes rebuild theirs after PLACE_INDEX_MAX_AGE
+        place_index.reset()
+        caches['responses'].clear()
+        return {"users": len(drivers) + len(riders), "drivers": len(drivers), **stats}
+
+    def timed(self, what, count, began):
+        elapsed = time.monotonic() - began
+        self.log(f"{count} {what} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f}/s)")
+
+    def create_users(self, count, driver_share):
+        rng = self.rng
+        began = time.monotonic()
+        drivers = max(int(count * driver_share), 1)
+
+        def rows():
+            for n in range(count):
+                driver = n < drivers
+                yield profile(
+                    email=f"{self.prefix}{n}@example.com", username=f"{self.prefix}-{n}", password=self.password,
+                    type_user=profile.conducteur if driver else profile.clien,
+                    age=int(rng.triangular(21, 65, 35) if driver else rng.triangular(18, 70, 25)),
+                )
+
+        for batch in batches(rows(), self.batch_size):
+            profile.objects.bulk_create(batch)
+        seeded = profile.objects.filter(username__startswith=f"{self.prefix}-").order_by('id')
+        driver_ids = list(seeded.filter(type_user=profile.conducteur).values_list('id', flat=True))
+        rider_ids = list(seeded.exclude(type_user=profile.conducteur).values_list('id', flat=True))
+        self.timed("users", count, began)
+        return driver_ids, rider_ids or driver_ids
+
+    def create_trips(self, drivers, riders, count, reservations, comments):
+        # the reservations and their comments are drawn trip by trip, each
+        # trip filled like a binomial over its seats
+        rng = self.rng
+        began = time.monotonic()
+        pairs, pair_weights = city_pairs()
+        pair_weights = list(accumulate(pair_weights))
+        hour_weights = list(accumulate(HOURS))
+        # a few drivers post most of the trips
+        activity = list(accumulate(rng.paretovariate(1.2) for _ in drivers))
+        fill = min(reservations / max(count * 3.2, 1), 1)  # 3.2 seats per trip on average
+        comment_rate = min(comments / reservations, 1) if reservations else 0
+        stats = {"posts": 0, "reservations": 0, "comments": 0}
+
+        def trip_rows():
+            for n in range(count):
+                depart, arrival, distance, along = rng.choices(pairs, cum_weights=pair_weights)[0]
+                hour = rng.choices(range(24), cum_weights=hour_weights)[0]
+                minute = rng.choice((0, 15, 30, 45))
+                depart_date = self.today + timedelta(
+                    days=rng.randrange(-PAST_DAYS, AHEAD_DAYS), hours=hour, minutes=minute,
+                )
+                seats = rng.choices(*SEATS)[0]
+                taken = sum(rng.random() < fill for _ in range(seats))
+                (depart_lat, depart_lon), (arrival_lat, arrival_lon) = around(rng, depart), around(rng, arrival)
+                depart, arrival = spelling(rng, depart[0]), spelling(rng, arrival[0])
+                stops = []
+                if along and rng.random() < STOPS_SHARE:
+                    picked = sorted(rng.sample(range(len(along)), rng.randint(1, min(len(along), 3))))
+                    stops = [spelling(rng, along[n]) for n in picked]
+                yield posts(
+                    title=f"{self.prefix}-{n}", author_post_id=rng.choices(drivers, cum_weights=activity)[0],
+                    depart_date=depart_date, arrival_date=depart_date + timedelta(minutes=int(distance / SPEED * 60) + 15),
+                    depart_place=depart, arrival_place=arrival,
+                    depart_key=normalize_place(depart), arrival_key=normalize_place(arrival),
+                    depart_lat=depart_lat, depart_lon=depart_lon, arrival_lat=arrival_lat, arrival_lon=arrival_lon,
+                    depart_geohash=geohash(depart_lat, depart_lon), arrival_geohash=geohash(arrival_lat, arrival_lon),
+                    stops=stops,
+                    price=max(round(distance * PRICE_PER_KM * rng.uniform(0.8, 1.2) / 50) * 50, 200),
+                    number_of_places=seats, reserved_places=taken, reserved=taken >= seats,
+                    smoker=rng.random() < 0.15, animals_autorised=rng.random() < 0.25,
+                )
+
+        for batch in batches(trip_rows(), self.batch_size):
+            posts.objects.bulk_create(batch)
+            waypoint.objects.bulk_create(
+                [stop for trip in batch for stop in route_waypoints(trip.pk, trip.route_keys())],
+                batch_size=self.batch_size,
+            )
+            visits, notes = [], []
+            for trip in batch:
+                for visitor in rng.sample(riders, min(trip.reserved_places, len(riders))):
+                    visits.append(history(post_id=trip.pk, visitor_id=visitor))
+                    if stats["comments"] + len(notes) < comments and rng.random() < comment_rate:
+                        notes.append(self.comment(visitor, trip.author_post_id, trip.author_post_id in self.bad_drivers))
+            history.objects.bulk_create(visits, batch_size=self.batch_size)
+            comments_rating.objects.bulk_create(notes, batch_size=self.batch_size)
+            stats["posts"] += len(batch)
+            stats["reservations"] += len(visits)
+            stats["comments"] += len(notes)
+        self.timed("posts", stats["posts"], began)
+        self.log(f"with {stats['reservations']} reservations and {stats['comments']} comments")
+        return stats
+
+    def comment(self, author, driver, bad):
+        rating = self.rng.choices(*(BAD_RATINGS if bad else RATINGS))[0]
+        return comments_rating(
+            title=f"Trajet noté {rating}/5", rating=rating, comment=COMMENTS[rating],
+            author_comment_id=author, received_user_id=driver,
+        )
+
+    def create_comments(self, drivers, riders, count):
+        # what the reservations didn't bring (more comments than places taken)
+        if count <= 0:
+            return 0
+        rng = self.rng
+        began = time.monotonic()
+        rows = (
+            self.comment(rng.choice(riders), driver, driver in self.bad_drivers)
+            for driver in (rng.choice(drivers) for _ in range(count))
+        )
+        for batch in batches(rows, self.batch_size):
+            comments_rating.objects.bulk_create(batch)
+        self.timed("extra comments", count, began)
+        return count
+
@@ -2,10 +2,17 @@ from django.contrib.auth.models import User # for users autentification
 from rest_framework import serializers # used to convert json data 
 from users.models import profile , comments_rating
 from posts.models import posts
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import tokens_for_user
+from .instrumentation import TimedSerializerMixin, serializing
+from datetime import datetime, time, timedelta
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+from users.images import thumbnail_urls
+from users.jobs import IMAGE_FIELDS, discard_replaced, enqueue_images
 from history.models import history
 # users serialzers
-class user_serializer (serializers.ModelSerializer):
+class user_serializer (TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=False)  # Make password optional
     
     class Meta : 
@@ -15,12 +22,14 @@ class user_serializer (serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = profile.objects.create_user(**validated_data)  
+        enqueue_images(user)  # decoding and thumbnails run off the request
         return user
 
     def update(self, instance, validated_data):
         # Remove password from validated_data if it's not provided
         if 'password' in validated_data and not validated_data['password']:
             validated_data.pop('password')
+        previous = {field: getattr(instance, field).name for field in IMAGE_FIELDS}
         
         for attr, value in validated_data.items():
             if attr == 'password':
@@ -29,11 +38,13 @@ class user_serializer (serializers.ModelSerializer):
                 setattr(instance, attr, value)
         
         instance.save()
+        enqueue_images(instance)
+        discard_replaced(instance, previous)
         return instance
 
     def to_representation(self, instance):
         
-        refresh = RefreshToken.for_user(instance)
+        refresh = tokens_for_user(instance)
 
         return {
             "user": {
@@ -45,12 +56,15 @@ class user_serializer (serializers.ModelSerializer):
                 "age": instance.age,
                 "ppermis_ic": instance.ppermis_ic.url if instance.ppermis_ic else None,
                 "user_pic": instance.user_pic.url if instance.user_pic else None,
+                "ppermis_ic_thumbs": thumbnail_urls(instance.ppermis_ic),
+                "user_pic_thumbs": thumbnail_urls(instance.user_pic),
+                "ppermis_ic_status": instance.ppermis_ic_status,
             },
             "refresh": str(refresh),
             "access": str(refresh.access_token),
         }    
 
-class userview_serializer (serializers.ModelSerializer):
+class userview_serializer (TimedSerializerMixin, serializers.ModelSerializer):
     class Meta : 
         model = profile
         fields = ["id","email","username","phone_number","type_user","age","password","phone_number","ppermis_ic", "user_pic"]
@@ -70,12 +84,36 @@ class userview_serializer (serializers.ModelSerializer):
                 "age": instance.age,
                 "ppermis_ic": instance.ppermis_ic.url if instance.ppermis_ic else None,
                 "user_pic": instance.user_pic.url if instance.user_pic else None,
+                "ppermis_ic_thumbs": thumbnail_urls(instance.ppermis_ic),
+                "user_pic_thumbs": thumbnail_urls(instance.user_pic),
+                "rating": instance.rating_average,
+                "rating_count": instance.rating_count,
             }
         }    
 
 
+# public profile inlined in posts when the client asks for ?expand=author
+class AuthorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    user_pic = serializers.SerializerMethodField()
+    user_pic_thumbs = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = profile
+        fields = ["id", "email", "username", "user_pic", "user_pic_thumbs", "rating"]
+
+    def get_user_pic(self, obj):
+        return obj.user_pic.url if obj.user_pic else None
+
+    def get_user_pic_thumbs(self, obj):
+        return thumbnail_urls(obj.user_pic)
+
+    def get_rating(self, obj):
+        return obj.rating_average
+
+
 # comments_rating serializer
-class CommentsSerializer (serializers.ModelSerializer):
+class CommentsSerializer (TimedSerializerMixin, serializers.ModelSerializer):
     author_comment = serializers.SerializerMethodField()
     
     class Meta : 
@@ -85,42 +123,160 @@ class CommentsSerializer (serializers.ModelSerializer):
     def get_author_comment(self, obj):
         return obj.author_comment.username
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', expand=()):
+        return queryset.select_related(prefix + 'author_comment')
+
 
 # posts serializer
-class PostsSerializer(serializers.ModelSerializer):
+MAX_STOPS = 10
+
+
+class TripDateTimeField(serializers.DateTimeField):
+    # the released app sends the time of day alone ("08:30:00"): kept as a
+    # time here, put on its next occurrence by validate_trip_dates
+    def to_internal_value(self, value):
+        if isinstance(value, str) and 'T' not in value and '-' not in value:
+            try:
+                moment = parse_time(value.strip())
+            except ValueError:
+                moment = None
+            if moment is not None:
+                return moment
+        return super().to_internal_value(value)
+
+
+def next_time(moment, after):
+    # the first datetime at this time of day (local time) from after on
+    value = timezone.make_aware(datetime.combine(timezone.localtime(after).date(), moment))
+    return value if value >= after else value + timedelta(days=1)
+
+
+def validate_trip_dates(attrs, instance=None):
+    now = timezone.now()
+    depart = attrs.get('depart_date', getattr(instance, 'depart_date', None))
+    if isinstance(depart, time):
+        depart = attrs['depart_date'] = next_time(depart, now)
+    arrival = attrs.get('arrival_date', getattr(instance, 'arrival_date', None))
+    if isinstance(arrival, time):
+        arrival = attrs['arrival_date'] = next_time(arrival, depart or now)
+    if 'depart_date' in attrs and depart < now:
+        raise serializers.ValidationError({'depart_date': "Le départ est déjà passé."})
+    if depart is not None and arrival is not None and arrival < depart:
+        raise serializers.ValidationError({'arrival_date': "L'arrivée est avant le départ."})
+    return attrs
+
+
+def stops_field():
+    return serializers.ListField(child=serializers.CharField(max_length=70), max_length=MAX_STOPS, required=False)
+
+
+class PostsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author_post = serializers.StringRelatedField() 
+    depart_date = TripDateTimeField()
+    arrival_date = TripDateTimeField()
+    stops = stops_field()
     class Meta : 
         model = posts
         fields = [ 'id',
     'title','author_post','depart_date','arrival_date','depart_place','arrival_place','number_of_places','animals_autorised','smoker','price',
+    'reserved_places','depart_lat','depart_lon','arrival_lat','arrival_lon','stops',
                  ]
+        read_only_fields = ['reserved_places']
         #extra_fields = {"autor": {"read_only": True}}
 
+    def validate(self, attrs):
+        return validate_coordinates(validate_trip_dates(attrs, self.instance), self.instance)
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        if 'author' in self.context.get('expand', ()):
+            representation['author'] = AuthorSerializer(instance.author_post).data
+        return representation
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', expand=()):
+        # author_post is rendered through profile.__str__, the expanded author
+        # reads its rating totals from the same row
+        return queryset.select_related(prefix + 'author_post')
+
 
+def validate_coordinates(attrs, instance=None):
+    # the lat and lon of an end go together, both or none
+    for end in ('depart', 'arrival'):
+        lat, lon = (
+            attrs.get(name, getattr(instance, name, None)) for name in (f'{end}_lat', f'{end}_lon')
+        )
+        if (lat is None) != (lon is None):
+            missing = f'{end}_lat' if lat is None else f'{end}_lon'
+            raise serializers.ValidationError({missing: "La latitude et la longitude vont ensemble."})
+    return attrs
+
+
+class PostSearchSerializer(serializers.Serializer):
+    # query string of the trip search: by place names, or by coordinates
+    # within radius km (posts.geo)
+    depart = serializers.CharField(max_length=70, required=False)
+    arrival = serializers.CharField(max_length=70, required=False)
+    depart_lat = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    depart_lon = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    arrival_lat = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    arrival_lon = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    radius = serializers.FloatField(min_value=0.1, max_value=100, default=10)
+    # also the trips passing through depart then arrival (their stops)
+    partial = serializers.BooleanField(default=False)
+    # departure window, the trips already gone are never returned
+    depart_after = serializers.DateTimeField(required=False)
+    depart_before = serializers.DateTimeField(required=False)
+    price_min = serializers.FloatField(min_value=0, required=False)
+    price_max = serializers.FloatField(min_value=0, required=False)
+    seats = serializers.IntegerField(min_value=1, required=False)
+    smoker = serializers.BooleanField(required=False)
+    animals = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        validate_coordinates(attrs)
+        if 'depart' not in attrs and 'depart_lat' not in attrs:
+            raise serializers.ValidationError({'depart': "Le départ (lieu ou coordonnées) est obligatoire."})
+        if 'depart_after' in attrs and 'depart_before' in attrs and attrs['depart_after'] > attrs['depart_before']:
+            raise serializers.ValidationError({'depart_before': "La fenêtre de départ est vide."})
+        return attrs
+
+
+class PostsUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    depart_date = TripDateTimeField(required=False)
+    arrival_date = TripDateTimeField(required=False)
+    stops = stops_field()
 
-class PostsUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = posts
         fields = '__all__'
         extra_kwargs = {
             'title': {'required': False},
-            'depart_date': {'required': False},
-            'arrival_date': {'required': False},
             'arrival_place': {'required': False},
             'depart_place': {'required': False},
             'price': {'required': False},
-            'reserved': {'required': False},
+            'reserved': {'read_only': True},
+            'reserved_places': {'read_only': True},
             'number_of_places': {'required': False},
             'smoker': {'required': False},
             'animals_autorised': {'required': False},
             'author_post' : {'read_only':True}
         }        
 
+    def validate_number_of_places(self, value):
+        if self.instance is not None and value < self.instance.reserved_places:
+            raise serializers.ValidationError("Des places sont déjà réservées sur ce trajet.")
+        return value
+
+    def validate(self, attrs):
+        return validate_coordinates(validate_trip_dates(attrs, self.instance), self.instance)
+
         
 
 
 # history serializer 
-class HistorySerializer(serializers.ModelSerializer):
+class HistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     post = PostsSerializer()  # Nested serializer for post details
     visitor = userview_serializer()  # Nested serializer for visitor details
     
@@ -128,6 +284,11 @@ class HistorySerializer(serializers.ModelSerializer):
         model = history
         fields = ['id', 'post', 'visitor', 'visited_at']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix='', expand=()):
+        queryset = queryset.select_related(prefix + 'visitor', prefix + 'post')
+        return PostsSerializer.setup_eager_loading(queryset, prefix + 'post__', expand)
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         # Format the date
@@ -135,4 +296,159 @@ class HistorySerializer(serializers.ModelSerializer):
             visited_at = instance.visited_at
             representation['visited_at'] = visited_at.strftime('%d %B %Y')
         return representation
-        
\ No newline at end of file
+
+
+# flat serializers: the json of PostsSerializer / HistorySerializer /
+# CommentsSerializer for the hot list endpoints, built straight from
+# values_list rows, without model instances nor one field object per value.
+# Read only, see FlatListMixin. A field added above must be added here too
+# (FlatSerializerTests compares both).
+
+def rating_average(count, total):  # profile.rating_average
+    return round(total / count, 2) if count else None
+
+
+def datetime_iso(value):  # serializers.DateTimeField().to_representation
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def image(field, name):
+    # (url, thumbnails) of a stored ImageField name
+    if not name:
+        return None, None
+    file = FieldFile(None, field, name)
+    return file.url, thumbnail_urls(file)
+
+
+class FlatSerializer:
+    columns = ()
+
+    def __init__(self, context=None):
+        self.context = context or {}
+
+    def get_columns(self):
+        return self.columns
+
+    def setup(self, queryset):
+        # named rows, the cursor pagination reads the ordering key by name
+        return queryset.values_list(*self.get_columns(), named=True)
+
+    def to_representation(self, rows):
+        with serializing():
+            return [self.row(row) for row in rows]
+
+    def row(self, row):
+        raise NotImplementedError
+
+
+class FlatPostsSerializer(FlatSerializer):
+    columns = (
+        'id', 'title', 'author_post__email', 'depart_date', 'arrival_date', 'depart_place', 'arrival_place',
+        'number_of_places', 'animals_autorised', 'smoker', 'price', 'reserved_places', 'depart_lat', 'depart_lon',
+        'arrival_lat', 'arrival_lon', 'stops',
+    )
+    author_columns = (
+        'author_post_id', 'author_post__username', 'author_post__user_pic', 'author_post__rating_count',
+        'author_post__rating_sum',
+    )
+    user_pic = profile._meta.get_field('user_pic')
+
+    def __init__(self, context=None, prefix=''):
+        super().__init__(context)
+        self.prefix = prefix
+        self.expand_author = 'author' in self.context.get('expand', ())
+
+    def get_columns(self):
+        columns = self.columns + self.author_columns if self.expand_author else self.columns
+        return tuple(self.prefix + column for column in columns)
+
+    def width(self):
+        return len(self.get_columns())
+
+    def row(self, row):
+        (id, title, email, depart_date, arrival_date, depart_place, arrival_place, places, animals, smoker,
+         price, reserved_places, depart_lat, depart_lon, arrival_lat, arrival_lon, stops, *author) = row
+        representation = {
+            'id': id,
+            'title': title,
+            'author_post': email,  # str(profile)
+            'depart_date': datetime_iso(depart_date),
+            'arrival_date': datetime_iso(arrival_date),
+            'depart_place': depart_place,
+            'arrival_place': arrival_place,
+            'number_of_places': places,
+            'animals_autorised': animals,
+            'smoker': smoker,
+            'price': price,
+            'reserved_places': reserved_places,
+            'depart_lat': depart_lat,
+            'depart_lon': depart_lon,
+            'arrival_lat': arrival_lat,
+            'arrival_lon': arrival_lon,
+            'stops': stops,
+        }
+        if author:
+            author_id, username, user_pic, rating_count, rating_sum = author
+            url, thumbs = image(self.user_pic, user_pic)
+            representation['author'] = {
+                'id': author_id, 'email': email, 'username': username, 'user_pic': url, 'user_pic_thumbs': thumbs,
+                'rating': rating_average(rating_count, rating_sum),
+            }
+        return representation
+
+
+class FlatHistorySerializer(FlatSerializer):
+    columns = (
+        'id', 'visited_at', 'visitor_id', 'visitor__email', 'visitor__username', 'visitor__phone_number',
+        'visitor__type_user', 'visitor__age', 'visitor__ppermis_ic', 'visitor__user_pic', 'visitor__rating_count',
+        'visitor__rating_sum',
+    )
+    ppermis_ic = profile._meta.get_field('ppermis_ic')
+    user_pic = profile._meta.get_field('user_pic')
+
+    def __init__(self, context=None):
+        super().__init__(context)
+        self.post = FlatPostsSerializer(self.context, prefix='post__')
+
+    def get_columns(self):
+        return self.columns + self.post.get_columns()
+
+    def row(self, row):
+        (id, visited_at, visitor_id, email, username, phone_number, type_user, age, ppermis_ic, user_pic,
+         rating_count, rating_sum) = row[:len(self.columns)]
+        ppermis_ic_url, ppermis_ic_thumbs = image(self.ppermis_ic, ppermis_ic)
+        user_pic_url, user_pic_thumbs = image(self.user_pic, user_pic)
+        return {
+            'id': id,
+            'post': self.post.row(row[len(self.columns):]),
+            'visitor': {'user': {  # userview_serializer
+                'id': visitor_id,
+                'email': email,
+                'username': username,
+                'phone_number': str(phone_number) if phone_number else None,
+                'type_user': type_user,
+                'age': age,
+                'ppermis_ic': ppermis_ic_url,
+                'user_pic': user_pic_url,
+                'ppermis_ic_thumbs': ppermis_ic_thumbs,
+                'user_pic_thumbs': user_pic_thumbs,
+                'rating': rating_average(rating_count, rating_sum),
+                'rating_count': rating_count,
+            }},
+            'visited_at': visited_at.strftime('%d %B %Y'),
+        }
+
+
+class FlatCommentsSerializer(FlatSerializer):
+    # id is only there for the cursor
+    columns = ('id', 'title', 'rating', 'comment', 'author_comment__username', 'received_user_id')
+
+    def row(self, row):
+        _, title, rating, comment, author, received_user = row
+        return {
+            'title': title, 'rating': rating, 'comment': comment, 'author_comment': author,
+            'received_user': received_user,
+        }
@@ -0,0 +1,73 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from users.models import profile, comments_rating
+from posts.models import posts
+from history.models import history
+from .authentication import active_cache_key
+from .cache import invalidate_user
+from .notifications import broker
+
+
+@receiver(post_save, sender=profile)
+@receiver(post_delete, sender=profile)
+def forget_active_state(sender, instance, **kwargs):
+    cache.delete(active_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=profile)
+@receiver(post_delete, sender=profile)
+def invalidate_profile_responses(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    # the comments this user wrote show his username
+    received = comments_rating.objects.filter(author_comment_id=instance.pk)
+    for user_id in received.values_list('received_user_id', flat=True).distinct():
+        invalidate_user(user_id)
+
+
+@receiver(post_save, sender=comments_rating)
+@receiver(post_delete, sender=comments_rating)
+def invalidate_comment_responses(sender, instance, **kwargs):
+    # the comment list and the rating totals of the rated user
+    invalidate_user(instance.received_user_id)
+    loaded = getattr(instance, '_loaded_rating', None)
+    if loaded is not None and loaded[0] != instance.received_user_id:
+        invalidate_user(loaded[0])
+
+
+# notifications (api.notifications), sent once the write is committed
+
+def notify(user_ids, event):
+    transaction.on_commit(lambda: [broker.publish(user_id, event) for user_id in user_ids])
+
+
+@receiver(post_save, sender=history)
+def notify_reservation(sender, instance, created, **kwargs):
+    if not created or not broker.listening():
+        return
+    post = instance.post  # already loaded by the reservation views
+    notify([post.author_post_id], broker.event(
+        "reservation", post_id=post.pk, title=post.title, visitor_id=instance.visitor_id,
+    ))
+
+
+@receiver(post_delete, sender=history)
+def notify_cancellation(sender, instance, **kwargs):
+    # a rider leaving a trip, the driver cancelling it or deleting the post
+    if not broker.listening():
+        return
+    post = posts.objects.filter(pk=instance.post_id).values('author_post_id', 'title').first()
+    if post is None:
+        return
+    notify([post['author_post_id'], instance.visitor_id], broker.event(
+        "cancellation", post_id=instance.post_id, title=post['title'], visitor_id=instance.visitor_id,
+    ))
+
+
+@receiver(post_save, sender=comments_rating)
+def notify_comment(sender, instance, created, **kwargs):
+    if created and broker.listening(instance.received_user_id):
+        notify([instance.received_user_id], broker.event(
+            "comment", title=instance.title, rating=instance.rating, author_id=instance.author_comment_id,
+        ))
@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.utils import timezone
+from posts.models import posts
+from users.models import profile
+
+# rows shared by the tests of every app
+
+
+def make_user(name):
+    return profile.objects.create(email=f"{name}@example.com", username=name)
+
+
+def at(hour, minute=0, days=1):
+    # hour:minute `days` from today
+    return (timezone.now() + timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def make_post(author, n, **kwargs):
+    fields = dict(
+        title=f"trip-{author.id}-{n}",
+        author_post=author,
+        depart_date=at(8),
+        arrival_date=at(10),
+        depart_place="Alger",
+        arrival_place="Oran",
+    )
+    fields.update(kwargs)
+    return posts.objects.create(**fields)
@@ -1,16 +1,63 @@
 from django.shortcuts import render
 from users.models import profile
 from rest_framework import generics
-from .serializers import user_serializer ,PostsSerializer, CommentsSerializer,HistorySerializer ,PostsUpdateSerializer ,userview_serializer 
-from rest_framework.permissions import AllowAny , IsAuthenticated
+from .serializers import user_serializer ,PostsSerializer, CommentsSerializer,HistorySerializer ,PostsUpdateSerializer ,userview_serializer ,PostSearchSerializer
+from .serializers import FlatPostsSerializer, FlatHistorySerializer, FlatCommentsSerializer
+from rest_framework.permissions import AllowAny , IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from rest_framework_simplejwt.tokens import RefreshToken
-from posts.models import posts 
+from .authentication import RefreshToken
+from posts.models import posts, normalize_place, passing_through
+from posts.geo import near
+from posts.places import place_index
 from users.models import comments_rating
 from history.models import history
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.http import Http404
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .mixins import EagerLoadingMixin, FlatListMixin
+from .cache import CachedResponseMixin
+from .instrumentation import metrics
+from django.http import HttpResponse
+
+class ProfileCacheMixin(CachedResponseMixin):
+    def get_cache_user_id(self):
+        if self.lookup_field == 'id':
+            return self.kwargs['id']
+        lookup = {self.lookup_field: self.kwargs[self.lookup_field]}
+        return profile.objects.filter(**lookup).values_list('id', flat=True).first()
+
+    async def aget_cache_user_id(self):
+        if self.lookup_field == 'id':
+            return self.kwargs['id']
+        lookup = {self.lookup_field: self.kwargs[self.lookup_field]}
+        return await profile.objects.filter(**lookup).values_list('id', flat=True).afirst()
+
+
+class CommentsCacheMixin(CachedResponseMixin):
+    received_lookup = ('username', 'received_user')  # profile field, url kwarg
+
+    def get_received_user(self):
+        if not hasattr(self, 'received_user'):
+            field, kwarg = self.received_lookup
+            self.received_user = get_object_or_404(profile, **{field: self.kwargs.get(kwarg)})
+        return self.received_user
+
+    async def aget_received_user(self):
+        if not hasattr(self, 'received_user'):
+            field, kwarg = self.received_lookup
+            self.received_user = await aget_object_or_404(profile, **{field: self.kwargs.get(kwarg)})
+        return self.received_user
+
+    def get_cache_user_id(self):
+        return self.get_received_user().id
+
+    async def aget_cache_user_id(self):
+        return (await self.aget_received_user()).id
+
 
 # users / profile 
 class CreatUserView(generics.CreateAPIView):
@@ -44,7 +91,7 @@ class UserUpdateView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return profile.objects.get(email=self.request.user.email) # Only allow updating the logged-in user's profile
+        return profile.objects.get(pk=self.request.user.pk) # Only allow updating the logged-in user's profile, request.user only holds the token claims
 
     def perform_update(self, serializer):
         serializer.save()  # The password handling is now done in the serializer
@@ -74,7 +121,7 @@ class UserDeleteView(generics.DestroyAPIView):
             status=status.HTTP_204_NO_CONTENT
         )
     
-class UserProfileView(generics.RetrieveAPIView):
+class UserProfileView(ProfileCacheMixin, generics.RetrieveAPIView):
     queryset = profile.objects.all()
     serializer_class = userview_serializer
     permission_classes = [IsAuthenticated]
@@ -82,7 +129,7 @@ class UserProfileView(generics.RetrieveAPIView):
     def get_queryset(self):
         username = self.kwargs.get("username")
         return profile.objects.filter(username=username) 
-class UserselfView(generics.RetrieveAPIView):
+class UserselfView(ProfileCacheMixin, generics.RetrieveAPIView):
     queryset = profile.objects.all()
     serializer_class = userview_serializer
     permission_classes = [IsAuthenticated]
@@ -91,7 +138,7 @@ class UserselfView(generics.RetrieveAPIView):
         id = self.kwargs.get("id")
         return profile.objects.filter(id =id )
     
-class UserProfileViewmail(generics.RetrieveAPIView):
+class UserProfileViewmail(ProfileCacheMixin, generics.RetrieveAPIView):
     queryset = profile.objects.all()
     serializer_class = userview_serializer
     permission_classes = [IsAuthenticated]
@@ -102,9 +149,12 @@ class UserProfileViewmail(generics.RetrieveAPIView):
     
 #posts 
 
-class CreatePost(generics.ListCreateAPIView):
+class CreatePost(FlatListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = PostsSerializer
+    flat_serializer_class = FlatPostsSerializer
     permission_classes = [IsAuthenticated]
+    expandable = ('author',)
+    legacy_list = True
 
     def get_queryset(self):
         user = self.request.user
@@ -112,7 +162,8 @@ class CreatePost(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         if serializer.is_valid():
-            serializer.save(author_post=self.request.user)
+            # by id: request.user only carries the token claims
+            serializer.save(author_post_id=self.request.user.pk)
         else:
             print(serializer.errors)
 
@@ -132,18 +183,80 @@ class UPdatePost(generics.UpdateAPIView):
         title = self.kwargs.get('title')
         return posts.objects.filter(title = title)
 
-class GetPosts(generics.ListAPIView):  #searhc posts 
+class GetPosts(FlatListMixin, EagerLoadingMixin, generics.ListAPIView):  #searhc posts 
     serializer_class = PostsSerializer
+    flat_serializer_class = FlatPostsSerializer
     permission_classes = [IsAuthenticated]
+    expandable = ('author',)
+    cursor_ordering = ('depart_date', 'id')  # keyset on the departure time
+    legacy_list = False
+
+    def get_search_params(self):
+        data = self.request.query_params.dict()
+        # the old find/<depart>/<arrival>/ route passes the places in the path
+        if "depart_place" in self.kwargs:
+            data["depart"] = self.kwargs["depart_place"]
+            data["arrival"] = self.kwargs["arrival_place"]
+        search = PostSearchSerializer(data=data)
+        search.is_valid(raise_exception=True)
+        return search.validated_data
 
     def get_queryset(self):
-        arrival_place = self.kwargs.get("arrival_place") 
-        depart_place = self.kwargs.get("depart_place")
-    
-        # Filter comments by depart_place and arrival_place
-        return posts.objects.filter(arrival_place=arrival_place, depart_place=depart_place)
+        params = self.get_search_params()
+        # only the live slice: the ranges of posts_search_idx / posts_geo_idx
+        # / posts_depart_idx start at now, the past trips are never read
+        now = timezone.now()
+        queryset = posts.objects.filter(
+            reserved=False, depart_date__gte=max(params.get("depart_after", now), now),
+        )
+        if "depart_before" in params:
+            queryset = queryset.filter(depart_date__lte=params["depart_before"])
+        # the coordinates win over the names: "Alger" and "Alger Centre" are
+        # a few km apart, not two places
+        points = {}
+        arrival = None
+        if "arrival_lat" in params:
+            points["arrival"] = (params["arrival_lat"], params["arrival_lon"])
+        elif "arrival" in params:
+            arrival = params["arrival"]
+        if "depart_lat" in params:
+            points["depart"] = (params["depart_lat"], params["depart_lon"])
+        elif params["partial"]:
+            # through the waypoints (the stops have no coordinates): board at
+            # depart, leave at arrival further along the route
+            queryset = queryset.filter(pk__in=passing_through(params["depart"], arrival))
+            arrival = None
+        else:
+            queryset = queryset.filter(depart_key=normalize_place(params["depart"]))
+        if arrival is not None:
+            queryset = queryset.filter(arrival_key=normalize_place(arrival))
+        if points:
+            queryset = near(queryset, params["radius"], **points)
+        if "price_min" in params:
+            queryset = queryset.filter(price__gte=params["price_min"])
+        if "price_max" in params:
+            queryset = queryset.filter(price__lte=params["price_max"])
+        if "seats" in params:
+            queryset = queryset.filter(number_of_places__gte=F('reserved_places') + params["seats"])
+        if "smoker" in params:
+            queryset = queryset.filter(smoker=params["smoker"])
+        if "animals" in params:
+            queryset = queryset.filter(animals_autorised=params["animals"])
+        return queryset.order_by('depart_date', 'id')
     
 
+class PlaceAutocomplete(APIView):  # suggestions while typing a place, served from memory
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        return Response(place_index.suggest(query, limit))
+
+
 #   ## check this again     no need for it i guess
 # class PostDetailView(generics.RetrieveAPIView):
     
@@ -156,14 +269,16 @@ class GetPosts(generics.ListAPIView):  #searhc posts
 
 
 # commenst_rating 
-class CreateComment(generics.ListCreateAPIView):
+class CreateComment(EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = CommentsSerializer
     permission_classes = [IsAuthenticated]
+    legacy_list = True
 
     def get_queryset(self):
         user = self.request.user # turn this into email in case of issue 
         return comments_rating.objects.filter(author_comment=user)
 
+    @transaction.atomic  # the comment and the rating totals of received_user
     def perform_create(self, serializer):
         if serializer.is_valid():
             received_username= self.kwargs.get("received_username")
@@ -173,14 +288,16 @@ class CreateComment(generics.ListCreateAPIView):
         else:
             print(serializer.errors)
             
-class CreateCommentmail(generics.ListCreateAPIView):
+class CreateCommentmail(EagerLoadingMixin, generics.ListCreateAPIView):
     serializer_class = CommentsSerializer
     permission_classes = [IsAuthenticated]
+    legacy_list = True
 
     def get_queryset(self):
         user = self.request.user # turn this into email in case of issue 
         return comments_rating.objects.filter(author_comment=user)
 
+    @transaction.atomic  # the comment and the rating totals of received_user
     def perform_create(self, serializer):
         if serializer.is_valid():
             received_email= self.kwargs.get("mail_username")
@@ -200,6 +317,17 @@ class DeleteComment(generics.DestroyAPIView):
         received_username= self.kwargs.get("received_username")
         received_user = get_object_or_404(profile, username=received_username)
         return comments_rating.objects.filter(author_comment=user, received_user= received_user)
+
+    def get_object(self):
+        # the url names the rated user, not the comment: take the last one
+        comment = self.get_queryset().order_by('-id').first()
+        if comment is None:
+            raise Http404
+        return comment
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
         
 # class UpdateComment(generics.UpdateAPIView):
 #     serializer_class = CommentsSerializer
@@ -217,36 +345,44 @@ class UpdateComment(generics.UpdateAPIView):
     serializer_class = CommentsSerializer
     permission_classes = [IsAuthenticated]
     def get_queryset(self):
-        username = self.kwargs.get("received_user")
+        username = self.kwargs.get("received_username")
         received_user = get_object_or_404(profile, username=username)
-        return comments_rating.objects.filter(received_user=received_user)
+        return comments_rating.objects.filter(received_user=received_user, author_comment=self.request.user)
+
+    def get_object(self):
+        comment = self.get_queryset().order_by('-id').first()
+        if comment is None:
+            raise Http404
+        return comment
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
 
 
-class GetComment(generics.ListAPIView):
+class GetComment(CommentsCacheMixin, FlatListMixin, EagerLoadingMixin, generics.ListAPIView):
     serializer_class = CommentsSerializer
+    flat_serializer_class = FlatCommentsSerializer
     permission_classes = [IsAuthenticated]
+    legacy_list = True
     def get_queryset(self):
-        username = self.kwargs.get("received_user")
-        received_user = get_object_or_404(profile, username=username)
-        return comments_rating.objects.filter(received_user=received_user)
+        return comments_rating.objects.filter(received_user=self.get_received_user())
     
-class GetCommentemail(generics.ListAPIView):
+class GetCommentemail(CommentsCacheMixin, FlatListMixin, EagerLoadingMixin, generics.ListAPIView):
     serializer_class = CommentsSerializer
+    flat_serializer_class = FlatCommentsSerializer
     permission_classes = [IsAuthenticated]
+    legacy_list = True
+    received_lookup = ('email', 'received_email')
     def get_queryset(self):
-        mail = self.kwargs.get("received_email")
-        received_user = get_object_or_404(profile, email=mail)
-        return comments_rating.objects.filter(received_user=received_user)
+        return comments_rating.objects.filter(received_user=self.get_received_user())
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
 
-
-class GetUserComment(generics.ListAPIView):
+class GetUserComment(FlatListMixin, EagerLoadingMixin, generics.ListAPIView):
     serializer_class = CommentsSerializer
+    flat_serializer_class = FlatCommentsSerializer
     permission_classes = [IsAuthenticated]
+    legacy_list = True
     def get_queryset(self):
         received_user = self.request.user  # in case of Error self.request.user.username
     
@@ -256,6 +392,19 @@ class GetUserComment(generics.ListAPIView):
 
 ######
 # check how tim deleted his note apply th same 
+def reserve_post(post, user):
+    # shared by Reservation and Reservationid
+    if history.objects.reserve(post, user) is None:
+        return Response(
+            {"error": "Ce trajet est déjà réservé"},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response({
+        "message": f"Le trajet '{post.title}' a été réservé avec succès.",
+        "post_id": post.id
+    })
+
+
 class Reservation(APIView):
     serializer_class = PostsSerializer
     permission_classes = [IsAuthenticated]
@@ -273,25 +422,7 @@ class Reservation(APIView):
 
     def post(self, request, title):
         post = get_object_or_404(posts, title=title)
-        if post.reserved:
-            return Response(
-                {"error": "Ce trajet est déjà réservé"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        post.reserved = True
-        post.save()
-        user = self.request.user
-
-        # Create the history record
-        history.objects.create(
-            post=post,
-            visitor=user
-        )
-        return Response({
-            "message": f"Le trajet '{post.title}' a été réservé avec succès.",
-            "post_id": post.id
-        })
+        return reserve_post(post, self.request.user)
 
 
 
@@ -302,25 +433,7 @@ class Reservationid(APIView):
 
     def post(self, request, id):
         post = get_object_or_404(posts, id=id)
-        if post.reserved:
-            return Response(
-                {"error": "Ce trajet est déjà réservé"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        post.reserved = True
-        post.save()
-        user = self.request.user
-
-        # Create the history record
-        history.objects.create(
-            post=post,
-            visitor=user
-        )
-        return Response({
-            "message": f"Le trajet '{post.title}' a été réservé avec succès.",
-            "post_id": post.id
-        })
+        return reserve_post(post, self.request.user)
 
 class Reservation_annule(APIView):
     permission_classes = [IsAuthenticated]
@@ -329,66 +442,76 @@ class Reservation_annule(APIView):
         
     def post(self, request, title):
         post = get_object_or_404(posts, title=title)
-        if not post.reserved:
+        # the driver cancels every reservation of his trip, a rider only his own
+        visitor = None if post.author_post_id == request.user.id else request.user
+        if not history.objects.cancel(post, visitor):
             return Response(
                 {"error": "Ce trajet n'est pas réservé"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        post.reserved = False
-        post.save()
-        history.objects.filter(post=post).delete()
         return Response({"message": f"La réservation du trajet '{post.title}' a été annulée."})
 
-class Reservationid(APIView):
-    serializer_class = PostsSerializer
-    lookup_field = 'id'
-    def post(self, request, title):
-        user= self.request.user
-        post = get_object_or_404(posts,id= id)
-        post.reserved = True
-        post.save()
-       
-
-
-        # Create the history record
-        history.objects.create(
-                depart_date = post.depart_date,
-                arrival_date = post.arrival_date,
-                depart_place = post.depart_place,
-                arrival_place = post.arrival_place,
-                price = post.price,
-            
-                visitor=user
-        )
-        return Response({"message": f"Post has been reserved."})
-
 
-class GetHistory(generics.ListAPIView) :
+class GetHistory(FlatListMixin, EagerLoadingMixin, generics.ListAPIView) :
     serializer_class = HistorySerializer
+    flat_serializer_class = FlatHistorySerializer
     permission_classes = [IsAuthenticated]
+    expandable = ('author',)
+    cursor_ordering = '-id'  # same order as visited_at, but unique
+    legacy_list = True
     
     def get_queryset(self):
         user = self.request.user
-        return history.objects.filter(visitor=user).order_by('-visited_at')
+        return history.objects.with_archive(visitor=user).order_by('-visited_at', '-id')
     
-class Getreservation(generics.ListAPIView) :
+class Gettrajet(FlatListMixin, EagerLoadingMixin, generics.ListAPIView):
     serializer_class = HistorySerializer
+    flat_serializer_class = FlatHistorySerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = '-id'  # same order as visited_at, but unique
+    legacy_list = True
     
     def get_queryset(self):
         user = self.request.user
-        post = get_object_or_404(posts,reserved = True , author_post = user)
-        return history.objects.filter(post = post).order_by('-visited_at')
+        # l'historique des places réservées sur les trajets de l'utilisateur, archives comprises
+        return history.objects.with_archive(post__author_post=user).order_by('-visited_at', '-id')
     
-class Gettrajet(generics.ListAPIView):
-    serializer_class = HistorySerializer
-    permission_classes = [IsAuthenticated]
+class Getreservation(Gettrajet) :
     
     def get_queryset(self):
         user = self.request.user
-        # Récupérer d'abord les posts de l'utilisateur qui sont réservés
-        user_posts = posts.objects.filter(author_post=user, reserved=True)
-        # Ensuite récupérer l'historique lié à ces posts
-        return history.objects.filter(post__in=user_posts).order_by('-visited_at')
-    
+        # the places taken on the driver's trips not arrived yet, full or
+        # not: the passengers shown on the driver screen
+        return history.objects.filter(
+            post__author_post=user, post__arrival_date__gte=timezone.now(),
+        ).order_by('-visited_at', '-id')
+
+
+# request metrics of this process (api.instrumentation), staff only
+
+class Metrics(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            recent = min(max(int(request.query_params.get("recent", 50)), 0), metrics.recent.maxlen)
+        except ValueError:
+            recent = 50
+        return Response(metrics.snapshot(recent))
+
+
+class PrometheusMetrics(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class RequestProfile(APIView):  # cProfile stats of a request sent with X-Profile
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, id):
+        text = metrics.profile(id)
+        if text is None:
+            raise Http404
+        return HttpResponse(text, content_type="text/plain; charset=utf-8")
@@ -1,8 +1,10 @@
+import re
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
-from api.views import CreatUserView, UserLogoutView, UserUpdateView, UserDeleteView, CreatePost, DeletePost, UPdatePost, GetPosts, GetUserComment, GetComment, GetHistory, UpdateComment, CreateComment, DeleteComment, Reservation, UserProfileView, UserselfView, Reservationid, UserProfileViewmail, GetCommentemail, Reservation_annule, CreateCommentmail, Gettrajet ,Getreservation
+from api.media import serve_media
+from api.async_views import NotificationStream, AsyncGetPosts, AsyncGetHistory, AsyncGetComment, AsyncGetCommentemail, AsyncUserProfileView, AsyncUserProfileViewmail, AsyncUserselfView
+from api.views import CreatUserView, UserLogoutView, UserUpdateView, UserDeleteView, CreatePost, DeletePost, UPdatePost, GetPosts, GetUserComment, GetComment, GetHistory, UpdateComment, CreateComment, DeleteComment, Reservation, UserProfileView, UserselfView, Reservationid, UserProfileViewmail, GetCommentemail, Reservation_annule, CreateCommentmail, Gettrajet ,Getreservation, PlaceAutocomplete, Metrics, PrometheusMetrics, RequestProfile
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -28,7 +30,9 @@ urlpatterns = [
     path('api/posts/creat_post/', CreatePost.as_view(), name='new_post'),
     path('api/posts/delete/<str:title>/', DeletePost.as_view(), name='delete_post'), #int:pk mean the number of the pots i.e id of teh post , because it needs to be specified 
     path('api/posts/update/<str:title>/', UPdatePost.as_view(), name='update_post'),
-    path('api/posts/find/<str:depart_place>/<str:arrival_place>/', GetPosts.as_view(), name='find_posts'), # see an exemple how it works im not sure if returs the posts or the id of posts 
+    path('api/posts/places/', PlaceAutocomplete.as_view(), name='places'), # ?q=alg&limit=10
+    path('api/posts/search/', GetPosts.as_view(), name='search_posts'), # ?depart=&arrival=&partial= (through the stops) or ?depart_lat=&depart_lon=&arrival_lat=&arrival_lon=&radius= (km), &depart_after=&depart_before=&price_min=&price_max=&seats=&smoker=&animals=&cursor=
+    path('api/posts/find/<str:depart_place>/<str:arrival_place>/', GetPosts.as_view(legacy_list=True), name='find_posts'), # see an exemple how it works im not sure if returs the posts or the id of posts 
 
     # path('api/posts/<str:title>/', PostDetailView.as_view(), name='detail_posts'), # see an exemple how it works im not sure if returs the posts or the id of posts 
     # add get post just add history view to same urls ? update : history is created when sending a get request for a posts , but not when searching 
@@ -49,8 +53,26 @@ urlpatterns = [
     path('api/user/trajet',Gettrajet.as_view(), name='user_trajet') , 
     path('api/user/myreservation',Getreservation.as_view(), name='user_trajet'),
 
+    # async versions of the read endpoints (api/async_views.py), same parameters and responses,
+    # for a uvicorn worker: uvicorn backend.asgi:application
+    path('api/async/posts/search/', AsyncGetPosts.as_view(), name='async_search_posts'),
+    path('api/async/posts/find/<str:depart_place>/<str:arrival_place>/', AsyncGetPosts.as_view(legacy_list=True), name='async_find_posts'),
+    path('api/async/user/history', AsyncGetHistory.as_view(), name='async_user_history'),
+    path('api/async/user/comments/<str:received_user>/', AsyncGetComment.as_view(), name='async_getcomments'),
+    path('api/async/user/comments/email/<str:received_email>/', AsyncGetCommentemail.as_view(), name='async_getcomments_email'),
+    path('api/async/user/<str:username>/', AsyncUserProfileView.as_view(), name='async_get_user'),
+    path('api/async/user/email/<str:email>/', AsyncUserProfileViewmail.as_view(), name='async_get_user_email'),
+    path('api/async/user/id/<int:id>/', AsyncUserselfView.as_view(), name='async_get_selfuser'),
+    path('api/async/user/events', NotificationStream.as_view(), name='user_events'), # server sent events, the websocket is /ws/notifications/?token=
+
+    # request metrics of this process (api/instrumentation.py), staff only
+    path('api/metrics/', Metrics.as_view(), name='metrics'), # ?recent=50
+    path('api/metrics/prometheus', PrometheusMetrics.as_view(), name='metrics_prometheus'),
+    path('api/metrics/profiles/<int:id>/', RequestProfile.as_view(), name='metrics_profile'), # id from the X-Profile-Id header
+
 ]
 
-# Add media serving in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# uploaded pictures, with cache headers and ranges (api/media.py). Turn
+# SERVE_MEDIA off when the front server or a CDN serves MEDIA_ROOT itself
+if settings.SERVE_MEDIA:
+    urlpatterns += [re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media')]
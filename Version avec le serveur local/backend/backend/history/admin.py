@@ -1,5 +1,7 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import history
-admin.site.register(history)
\ No newline at end of file
+from .models import archived_history, archived_post, history
+admin.site.register(history)
+admin.site.register(archived_post)
+admin.site.register(archived_history)
\ No newline at end of file
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0007_remove_history_arrival_date_and_more'),
+        ('posts', '0012_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['visitor', '-id'], name='history_visitor_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['post', '-id'], name='history_post_page_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0008_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='archived_post',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=25)),
+                ('created_at', models.DateTimeField()),
+                ('depart_date', models.DateTimeField()),
+                ('arrival_date', models.DateTimeField()),
+                ('depart_place', models.CharField(max_length=70)),
+                ('arrival_place', models.CharField(max_length=70)),
+                ('price', models.FloatField(default=0)),
+                ('number_of_places', models.IntegerField(default=1)),
+                ('reserved_places', models.IntegerField(default=0)),
+                ('smoker', models.BooleanField(default=False)),
+                ('animals_autorised', models.BooleanField(default=False)),
+                ('depart_lat', models.FloatField(blank=True, null=True)),
+                ('depart_lon', models.FloatField(blank=True, null=True)),
+                ('arrival_lat', models.FloatField(blank=True, null=True)),
+                ('arrival_lon', models.FloatField(blank=True, null=True)),
+                ('stops', models.JSONField(blank=True, default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('author_post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_posts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='archived_history',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('visited_at', models.DateField()),
+                ('visitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_visits', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visited_post', to='history.archived_post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['visitor', '-id'], name='history_archive_visitor_idx'), models.Index(fields=['post', '-id'], name='history_archive_post_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_double_visits(apps, schema_editor):
+    # the places taken twice by one visitor before the constraint: the
+    # first row is kept and the trip's seat count follows
+    history = apps.get_model('history', 'history')
+    posts = apps.get_model('posts', 'posts')
+    doubles = history.objects.values('post', 'visitor').annotate(n=Count('id'), first=Min('id')).filter(n__gt=1)
+    for double in doubles:
+        history.objects.filter(post=double['post'], visitor=double['visitor']).exclude(id=double['first']).delete()
+        post = posts.objects.get(pk=double['post'])
+        post.reserved_places = history.objects.filter(post=post).count()
+        post.reserved = post.reserved_places >= post.number_of_places
+        post.save(update_fields=['reserved_places', 'reserved'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('history', '0009_archived_trips'),
+        ('posts', '0015_posts_departure_datetimes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_double_visits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='history',
+            constraint=models.UniqueConstraint(fields=('post', 'visitor'), name='history_one_visit_per_post'),
+        ),
+    ]
@@ -1,14 +1,197 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, Value, When
 from users.models import profile
 from posts.models import posts
 import datetime
 # Create your models here.
 
+
+class HistoryManager(models.Manager):
+    # a reservation is one history row + one place taken on the post, both
+    # happen in the same transaction or not at all
+
+    def reserve(self, post, visitor):
+        # returns the new history row, or None when the trip is full or the
+        # visitor already has a place on it
+        try:
+            with transaction.atomic():
+                # conditional update first: the database decides who gets the
+                # last place, and the row stays locked until the commit
+                taken = posts.objects.filter(
+                    pk=post.pk, reserved_places__lt=F('number_of_places'),
+                ).update(
+                    reserved_places=F('reserved_places') + 1,
+                    reserved=Case(
+                        When(number_of_places__lte=F('reserved_places') + 1, then=Value(True)),
+                        default=Value(False),
+                    ),
+                )
+                if not taken:
+                    return None
+                # under the lock, a twin request of the same visitor waits
+                # above and sees this row once we commit
+                if self.filter(post=post, visitor=visitor).exists():
+                    transaction.set_rollback(True)
+                    return None
+                return self.create(post=post, visitor=visitor)
+        except IntegrityError:
+            # history_one_visit_per_post, where the lock didn't serialize them
+            return None
+
+    def cancel(self, post, visitor=None):
+        # frees the places held by visitor on post (every visitor if None),
+        # returns how many reservations were cancelled
+        with transaction.atomic():
+            rows = self.filter(post=post)
+            if visitor is not None:
+                rows = rows.filter(visitor=visitor)
+            cancelled, _ = rows.delete()
+            if cancelled:
+                posts.objects.filter(pk=post.pk).update(
+                    reserved_places=Case(
+                        When(reserved_places__gt=cancelled, then=F('reserved_places') - cancelled),
+                        default=Value(0),
+                    ),
+                    reserved=False,
+                )
+            return cancelled
+
+    def with_archive(self, **filters):
+        # the reservations matching filters, still in history or already
+        # moved to archived_history by `manage.py archive_trips`
+        return Archived(self.filter(**filters), archived_history.objects.filter(**filters))
+
+
+class Archived:
+    # a queryset on the hot tables and its twin on the archive ones (same
+    # field names), read as one list: filter / order_by / select_related /
+    # values_list go to both, the rows come from a single UNION ALL in the
+    # order of the hot one. Only what the list views and the cursor
+    # pagination use of a QuerySet
+
+    def __init__(self, hot, archive):
+        self.hot = hot
+        self.archive = archive
+
+    def both(self, method, *args, **kwargs):
+        return Archived(getattr(self.hot, method)(*args, **kwargs), getattr(self.archive, method)(*args, **kwargs))
+
+    def filter(self, *args, **kwargs):
+        return self.both('filter', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self.both('order_by', *fields)
+
+    def select_related(self, *fields):
+        return self.both('select_related', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self.both('values_list', *fields, **kwargs)
+
+    def union(self, stop=None):
+        hot, archive = self.hot, self.archive
+        if stop is not None and connections[hot.db].features.supports_slicing_ordering_in_compound:
+            # each side stops at the page too (postgres reads them off the
+            # indexes), sqlite only takes the limit on the whole union
+            hot, archive = hot[:stop], archive[:stop]
+        else:
+            hot, archive = hot.order_by(), archive.order_by()
+        return hot.union(archive, all=True).order_by(*self.hot.query.order_by)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self.union(k.stop)[k]
+        return self.union(k + 1)[k]
+
+    def __iter__(self):
+        return iter(self.union())
+
+    def __aiter__(self):
+        return self.union().__aiter__()
+
+
 class history (models.Model):
     post = models.ForeignKey(posts ,on_delete=models.CASCADE, related_name='visited_post')
     visited_at = models.DateField(auto_now_add=True)
     visitor = models.ForeignKey(profile ,on_delete=models.CASCADE, related_name='visitor')
+
+    objects = HistoryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'visitor'], name='history_one_visit_per_post'),
+        ]
+        indexes = [
+            models.Index(fields=['visitor', '-id'], name='history_visitor_page_idx'),
+            models.Index(fields=['post', '-id'], name='history_post_page_idx'),
+        ]
+    def __str__(self):
+
+        return f"{self.visitor.username} visited {self.post.title} on {self.visited_at}"
+    
+
+# finished trips and their reservations, moved out of posts / history by
+# `manage.py archive_trips` with their ids: the live tables only keep what
+# the search and the reservations need. Field names are the ones of
+# posts / history so the history views read both (history.objects.with_archive)
+
+
+class archived_post(models.Model):
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=25)  # free again for the new trips
+    author_post = models.ForeignKey(profile, on_delete=models.CASCADE, related_name='archived_posts')
+    created_at = models.DateTimeField()
+    depart_date = models.DateTimeField()
+    arrival_date = models.DateTimeField()
+    depart_place = models.CharField(max_length=70)
+    arrival_place = models.CharField(max_length=70)
+    price = models.FloatField(default=0)
+    number_of_places = models.IntegerField(default=1)
+    reserved_places = models.IntegerField(default=0)
+    smoker = models.BooleanField(default=False)
+    animals_autorised = models.BooleanField(default=False)
+    depart_lat = models.FloatField(null=True, blank=True)
+    depart_lon = models.FloatField(null=True, blank=True)
+    arrival_lat = models.FloatField(null=True, blank=True)
+    arrival_lon = models.FloatField(null=True, blank=True)
+    stops = models.JSONField(default=list, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
+        return self.title
+
+
+class archived_history(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(archived_post, on_delete=models.CASCADE, related_name='visited_post')
+    visited_at = models.DateField()
+    visitor = models.ForeignKey(profile, on_delete=models.CASCADE, related_name='archived_visits')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['visitor', '-id'], name='history_archive_visitor_idx'),
+            models.Index(fields=['post', '-id'], name='history_archive_post_idx'),
+        ]
+
+    def __str__(self):
         return f"{self.visitor.username} visited {self.post.title} on {self.visited_at}"
-    
\ No newline at end of file
+
+
+def archive_trips(ids, before):
+    # moves these posts and their history rows to the archive tables, in
+    # the caller's transaction, if they arrived before `before`. The posts
+    # are locked first and the date checked under the lock: a reservation
+    # racing the move waits, then finds no trip, and a trip pushed back
+    # since the ids were read stays
+    fields = [field.attname for field in archived_post._meta.concrete_fields if field.name != 'archived_at']
+    trips = list(
+        posts.objects.select_for_update().filter(id__in=ids, arrival_date__lt=before).values(*fields)
+    )
+    if not trips:
+        return 0, 0
+    ids = [trip['id'] for trip in trips]
+    archived_post.objects.bulk_create([archived_post(**trip) for trip in trips])
+    visits = history.objects.filter(post_id__in=ids).values('id', 'post_id', 'visitor_id', 'visited_at')
+    visits = archived_history.objects.bulk_create([archived_history(**visit) for visit in visits])
+    posts.objects.filter(id__in=ids).delete()  # with their history and waypoint rows
+    return len(trips), len(visits)
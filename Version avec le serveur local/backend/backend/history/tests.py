@@ -1,3 +1,100 @@
-from django.test import TestCase
+import random
+import threading
+import time
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase
+from history.models import history
+from api.testing import make_post, make_user
 
-# Create your tests here.
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        self.driver = make_user("driver")
+        self.riders = [make_user(f"r{n}") for n in range(3)]
+        self.post = make_post(self.driver, 1, number_of_places=2)
+
+    def test_seats_are_counted(self):
+        self.assertIsNotNone(history.objects.reserve(self.post, self.riders[0]))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.reserved_places, self.post.reserved), (1, False))
+        self.assertIsNotNone(history.objects.reserve(self.post, self.riders[1]))
+        self.assertIsNone(history.objects.reserve(self.post, self.riders[2]))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.reserved_places, self.post.reserved), (2, True))
+        self.assertEqual(history.objects.filter(post=self.post).count(), 2)
+
+    def test_one_place_per_rider(self):
+        history.objects.reserve(self.post, self.riders[0])
+        self.assertIsNone(history.objects.reserve(self.post, self.riders[0]))
+
+    def test_cancel_frees_places(self):
+        for rider in self.riders[:2]:
+            history.objects.reserve(self.post, rider)
+        self.assertEqual(history.objects.cancel(self.post, self.riders[0]), 1)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.reserved_places, self.post.reserved), (1, False))
+        self.assertEqual(history.objects.cancel(self.post), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.reserved_places, 0)
+        self.assertEqual(history.objects.cancel(self.post), 0)
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    # many riders hammer the same trip at once, the seat count must never
+    # go past the number of places
+
+    riders_count = 20
+    places = 5
+
+    def hammer(self, post, riders):
+        # one thread per rider, all calling reserve together
+        barrier = threading.Barrier(len(riders))
+        results = []
+
+        def attempt(rider):
+            barrier.wait()
+            try:
+                for _ in range(200):
+                    try:
+                        results.append(history.objects.reserve(post, rider) is not None)
+                        return
+                    except OperationalError:
+                        # sqlite answers "database is locked" instead of waiting
+                        # when the test database is in memory
+                        time.sleep(random.uniform(0.001, 0.02))
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(rider,)) for rider in riders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), len(riders))
+        return results
+
+    def test_no_overbooking(self):
+        driver = make_user("driver")
+        riders = [make_user(f"r{n}") for n in range(self.riders_count)]
+        post = make_post(driver, 1, number_of_places=self.places)
+        results = self.hammer(post, riders)
+
+        post.refresh_from_db()
+        self.assertEqual(results.count(True), self.places)
+        self.assertEqual(post.reserved_places, self.places)
+        self.assertTrue(post.reserved)
+        self.assertEqual(history.objects.filter(post=post).count(), self.places)
+
+    def test_one_place_per_rider(self):
+        # the same rider double tapping: one seat, whatever the interleaving
+        driver = make_user("driver")
+        rider = make_user("rider")
+        post = make_post(driver, 1, number_of_places=self.places)
+        results = self.hammer(post, [rider] * 10)
+
+        post.refresh_from_db()
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(post.reserved_places, 1)
+        self.assertEqual(history.objects.filter(post=post).count(), 1)
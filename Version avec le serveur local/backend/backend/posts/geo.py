@@ -0,0 +1,116 @@
+import math
+from functools import reduce
+from itertools import product
+from operator import and_
+from django.db.models import F, Q
+
+# trip search by coordinates without PostGIS. Each end of a post keeps a
+# geohash (posts.depart_geohash / arrival_geohash, GEOHASH_PRECISION chars):
+# the points of a geohash cell share its prefix, so the posts in a cell are
+# one range of the btree index. A search around a point turns its radius
+# into the few cells covering it (covering_cells), one range each, then
+# keeps the rows really within the radius with a flat earth distance
+# computed in sql (fine at a few tens of km).
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5 m
+EARTH_RADIUS = 6371.0  # km
+KM_PER_DEGREE = 111.32  # of latitude, or of longitude at the equator
+MAX_CELLS = 64  # ranges of one search, the coarser precision is taken past it
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # the bits alternate, longitude first
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (degrees of latitude, degrees of longitude) of a cell
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(h))
+
+
+def bounding_box(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return max(lat - dlat, -90.0), min(lat + dlat, 90.0), max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def covering_cells(lat, lon, radius_km, max_cells=MAX_CELLS):
+    # the geohashes, as fine as possible within max_cells, whose cells cover
+    # the box around the circle
+    south, north, west, east = bounding_box(lat, lon, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        columns = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * columns > max_cells and precision > 1:
+            continue
+        cells = set()
+        for row in range(rows):
+            cell_lat = min(south + row * height, north)
+            for column in range(columns):
+                cells.add(encode(cell_lat, min(west + column * width, east), precision))
+        return sorted(cells)
+
+
+def within(radius_km, **ends):
+    # Q of the posts whose ends (<prefix>=(lat, lon)) are all within
+    # radius_km: the cell ranges for the index, then the distances. With
+    # both ends each range is a (depart cell, arrival cell) pair so the two
+    # columns of posts_geo_idx narrow the scan, not only the first one
+    max_cells = max(int(MAX_CELLS ** (1 / len(ends))), 1) if ends else MAX_CELLS
+    ranges = [
+        [
+            # '~' sorts after every base32 char: [cell, cell~) are the hashes starting with cell
+            Q(**{f'{prefix}_geohash__gte': cell, f'{prefix}_geohash__lt': cell + '~'})
+            for cell in covering_cells(lat, lon, radius_km, max_cells)
+        ]
+        for prefix, (lat, lon) in ends.items()
+    ]
+    cells = Q()
+    for combination in product(*ranges):
+        cells |= reduce(and_, combination)
+    for prefix in ends:
+        cells &= Q(**{f'{prefix}_distance2__lte': radius_km ** 2})
+    return cells
+
+
+def squared_distance(prefix, lat, lon):
+    # equirectangular distance (km²) to the point, only + and * so any
+    # database runs it, annotate it as <prefix>_distance2 for within()
+    ky = KM_PER_DEGREE
+    kx = KM_PER_DEGREE * math.cos(math.radians(lat))
+    dy = (F(f'{prefix}_lat') - lat) * ky
+    dx = (F(f'{prefix}_lon') - lon) * kx
+    return dy * dy + dx * dx
+
+
+def near(queryset, radius_km, **ends):
+    # near(posts.objects.all(), 10, depart=(lat, lon), arrival=(lat, lon))
+    distances = {f'{prefix}_distance2': squared_distance(prefix, lat, lon) for prefix, (lat, lon) in ends.items()}
+    return queryset.alias(**distances).filter(within(radius_km, **ends))
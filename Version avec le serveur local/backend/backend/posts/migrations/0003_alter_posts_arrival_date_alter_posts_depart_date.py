@@ -3,6 +3,20 @@
 from django.db import migrations, models
 
 
+class AlterDateToTime(migrations.AlterField):
+    # postgres refuses to cast a date to a time (sqlite doesn't care), go
+    # through timestamp: the old dates become midnight
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        schema_editor.execute(
+            f"ALTER TABLE {schema_editor.quote_name(model._meta.db_table)} "
+            f"ALTER COLUMN {column} TYPE time USING {column}::timestamp::time"
+        )
+
+
 class Migration(migrations.Migration):
 
     dependencies = [
@@ -10,12 +24,12 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.AlterField(
+        AlterDateToTime(
             model_name='posts',
             name='arrival_date',
             field=models.TimeField(),
         ),
-        migrations.AlterField(
+        AlterDateToTime(
             model_name='posts',
             name='depart_date',
             field=models.TimeField(),
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:40
+
+import unicodedata
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_place(value):
+    # posts.models.normalize_place as of this migration
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())
+
+
+def fill_place_keys(apps, schema_editor):
+    posts = apps.get_model('posts', 'posts')
+    for post in posts.objects.only('id', 'depart_place', 'arrival_place').iterator():
+        posts.objects.filter(pk=post.pk).update(
+            depart_key=normalize_place(post.depart_place),
+            arrival_key=normalize_place(post.arrival_place),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_alter_posts_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='arrival_key',
+            field=models.CharField(default='', editable=False, max_length=70),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='depart_key',
+            field=models.CharField(default='', editable=False, max_length=70),
+        ),
+        migrations.RunPython(fill_place_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['depart_key', 'arrival_key', 'reserved', 'depart_date'], name='posts_search_idx'),
+        ),
+    ]
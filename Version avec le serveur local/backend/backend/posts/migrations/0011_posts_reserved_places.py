@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+def fill_reserved_places(apps, schema_editor):
+    # before seat accounting a reserved trip was a full trip
+    posts = apps.get_model('posts', 'posts')
+    posts.objects.filter(reserved=True).update(reserved_places=models.F('number_of_places'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_posts_place_keys_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='reserved_places',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_reserved_places, migrations.RunPython.noop),
+    ]
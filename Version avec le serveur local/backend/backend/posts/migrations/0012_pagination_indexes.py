@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_posts_reserved_places'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['author_post', '-id'], name='posts_author_page_idx'),
+        ),
+    ]
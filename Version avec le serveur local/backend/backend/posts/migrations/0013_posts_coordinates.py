@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:31
+
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posts',
+            name='arrival_geohash',
+            field=models.CharField(default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='arrival_lat',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='arrival_lon',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='depart_geohash',
+            field=models.CharField(default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='depart_lat',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='depart_lon',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['depart_geohash', 'arrival_geohash'], name='posts_geo_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_routes(apps, schema_editor):
+    # the existing posts have no stops, their route is depart -> arrival
+    posts = apps.get_model('posts', 'posts')
+    waypoint = apps.get_model('posts', 'waypoint')
+    rows = []
+    for post_id, depart_key, arrival_key in posts.objects.values_list('id', 'depart_key', 'arrival_key').iterator():
+        rows += [
+            waypoint(post_id=post_id, position=0, key=depart_key),
+            waypoint(post_id=post_id, position=1, key=arrival_key),
+        ]
+        if len(rows) >= 5000:
+            waypoint.objects.bulk_create(rows)
+            rows = []
+    waypoint.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_posts_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='waypoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('key', models.CharField(max_length=70)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='posts',
+            name='stops',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['depart_date', 'id'], name='posts_depart_idx'),
+        ),
+        migrations.AddField(
+            model_name='waypoint',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='route', to='posts.posts'),
+        ),
+        migrations.RunPython(fill_routes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='waypoint',
+            index=models.Index(fields=['key', 'post', 'position'], name='posts_waypoint_key_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='waypoint',
+            constraint=models.UniqueConstraint(fields=('post', 'position'), name='posts_waypoint_position'),
+        ),
+    ]
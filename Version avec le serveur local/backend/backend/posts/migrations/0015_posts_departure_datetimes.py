@@ -0,0 +1,85 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class TimeToDateTime(migrations.AlterField):
+    # the times had no day: take the day the post was created (utc), and
+    # the day after for an arrival earlier than the departure (after=)
+    def __init__(self, *args, after=None, **kwargs):
+        self.after = after
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        if self.after is not None:
+            kwargs['after'] = self.after
+        return name, args, kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        created = schema_editor.quote_name(model._meta.get_field('created_at').column)
+        after = schema_editor.quote_name(model._meta.get_field(self.after).column) if self.after else None
+        if schema_editor.connection.vendor == 'postgresql':
+            # no cast from time to timestamp, date + time is one
+            day = f"({created} AT TIME ZONE 'UTC')::date"
+            if after:
+                day += f" + CASE WHEN {column} < {after} THEN 1 ELSE 0 END"
+            schema_editor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} "
+                f"TYPE {model._meta.get_field(self.name).db_type(schema_editor.connection)} "
+                f"USING (({day}) + {column}) AT TIME ZONE 'UTC'"
+            )
+            return
+        # sqlite copies the 'HH:MM:SS' texts as they are, complete them
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+        shift = f"CASE WHEN {column} < {after} THEN '+1 day' ELSE '+0 days' END" if after else "'+0 days'"
+        schema_editor.execute(
+            f"UPDATE {table} SET {column} = datetime(date({created}) || ' ' || {column}, {shift})"
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        # back to the utc time of the day
+        model = to_state.apps.get_model(app_label, self.model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        column = schema_editor.quote_name(model._meta.get_field(self.name).column)
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE time USING ({column} AT TIME ZONE 'UTC')::time"
+            )
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)  # not ours, see above
+        schema_editor.execute(f"UPDATE {table} SET {column} = time({column})")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_posts_stops_waypoints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='posts',
+            name='posts_geo_idx',
+        ),
+        TimeToDateTime(
+            model_name='posts',
+            name='arrival_date',
+            field=models.DateTimeField(),
+            after='depart_date',
+        ),
+        TimeToDateTime(
+            model_name='posts',
+            name='depart_date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='posts',
+            index=models.Index(fields=['depart_geohash', 'arrival_geohash', 'depart_date'], name='posts_geo_idx'),
+        ),
+    ]
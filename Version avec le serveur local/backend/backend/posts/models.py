@@ -1,6 +1,22 @@
+import unicodedata
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.utils.translation import gettext_lazy as _
 from users.models import profile
+from .geo import encode
+
+
+def normalize_place(value):
+    # "  Béjaïa   Centre" and "bejaia centre" must hit the same index entry
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(value.casefold().split())
+
+
+def geohash(lat, lon):
+    return encode(lat, lon) if lat is not None and lon is not None else ''
+
 
 class posts(models.Model):
    
@@ -8,15 +24,110 @@ class posts(models.Model):
     title = models.CharField(max_length=25,unique=True)
     author_post = models.ForeignKey(profile ,on_delete=models.CASCADE, related_name='author_post')
     created_at = models.DateTimeField(auto_now_add=True)
-    depart_date = models.TimeField()
-    arrival_date = models.TimeField() 
+    depart_date = models.DateTimeField()
+    arrival_date = models.DateTimeField()
     depart_place = models.CharField(max_length=70)
     arrival_place = models.CharField(max_length=70)
     price = models.FloatField(default=0)
     reserved = models.BooleanField(default=False)
     number_of_places=models.IntegerField(default=1)
+    reserved_places = models.IntegerField(default=0)  # reserved is set once every place is taken
     smoker = models.BooleanField(default=False)
     animals_autorised = models.BooleanField(default=False)
+    # normalized copies of the places, filled on save, used by the search
+    depart_key = models.CharField(max_length=70, default='', editable=False)
+    arrival_key = models.CharField(max_length=70, default='', editable=False)
+    # optional coordinates of both ends, and their geohash (filled on save)
+    # for the search around a point, see posts.geo
+    depart_lat = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    depart_lon = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    arrival_lat = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    arrival_lon = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    depart_geohash = models.CharField(max_length=12, default='', editable=False)
+    arrival_geohash = models.CharField(max_length=12, default='', editable=False)
+    # places the driver passes through, in order, between depart and arrival
+    stops = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['depart_key', 'arrival_key', 'reserved', 'depart_date'],
+                name='posts_search_idx',
+            ),
+            models.Index(fields=['author_post', '-id'], name='posts_author_page_idx'),
+            models.Index(fields=['depart_geohash', 'arrival_geohash', 'depart_date'], name='posts_geo_idx'),
+            # the search through the stops walks the departures in order and
+            # probes the route of each, see passing_through
+            models.Index(fields=['depart_date', 'id'], name='posts_depart_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored places so the signals can tell what changed
+        instance._loaded_places = (
+            instance.__dict__.get('depart_place'), instance.__dict__.get('arrival_place'),
+        )
+        # and the route, to rewrite its waypoints only when it changes
+        instance._loaded_route = instance.route_keys() if {'depart_key', 'arrival_key', 'stops'} <= set(
+            instance.__dict__
+        ) else None
+        return instance
+
+    def route_keys(self):
+        return [self.depart_key, *(normalize_place(stop) for stop in self.stops or ()), self.arrival_key]
+
+    def save(self, *args, **kwargs):
+        self.depart_key = normalize_place(self.depart_place)
+        self.arrival_key = normalize_place(self.arrival_place)
+        self.depart_geohash = geohash(self.depart_lat, self.depart_lon)
+        self.arrival_geohash = geohash(self.arrival_lat, self.arrival_lon)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'depart_place' in update_fields:
+                update_fields.add('depart_key')
+            if 'arrival_place' in update_fields:
+                update_fields.add('arrival_key')
+            if update_fields & {'depart_lat', 'depart_lon'}:
+                update_fields.add('depart_geohash')
+            if update_fields & {'arrival_lat', 'arrival_lon'}:
+                update_fields.add('arrival_geohash')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return self.title 
\ No newline at end of file
+        return self.title 
+
+
+class waypoint(models.Model):
+    # one row per place of a post's route (depart at 0, the stops, arrival
+    # last), kept by the posts signals: the index of the search through the
+    # stops, a rider can board and leave anywhere along the way
+    post = models.ForeignKey(posts, on_delete=models.CASCADE, related_name='route')
+    position = models.PositiveSmallIntegerField()
+    key = models.CharField(max_length=70)  # normalize_place
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'position'], name='posts_waypoint_position'),
+        ]
+        indexes = [
+            models.Index(fields=['key', 'post', 'position'], name='posts_waypoint_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}#{self.position} {self.key}"
+
+
+def route_waypoints(post_id, keys):
+    return [waypoint(post_id=post_id, position=n, key=key) for n, key in enumerate(keys)]
+
+
+def passing_through(depart, arrival=None):
+    # ids of the posts whose route goes through depart and then arrival (or
+    # anywhere, past depart), stops included
+    later = waypoint.objects.filter(post=OuterRef('post'), position__gt=OuterRef('position'))
+    if arrival is not None:
+        later = later.filter(key=normalize_place(arrival))
+    return waypoint.objects.filter(key=normalize_place(depart)).filter(Exists(later)).values('post')
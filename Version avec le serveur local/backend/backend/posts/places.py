@@ -0,0 +1,181 @@
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db.models import Count
+from .models import posts, normalize_place
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PlaceTable:
+    # autocomplete over the distinct depart/arrival places of posts.
+    # a prefix trie (every word of a place is an entry point, so "centre"
+    # finds "alger centre") plus a trigram index for typos. Each node of the
+    # trie keeps the keys below it, so a prefix lookup is one walk down.
+    # Not thread safe, PlaceIndex holds the lock.
+
+    def __init__(self):
+        self._counts = Counter()            # key -> number of posts using it
+        self._labels = defaultdict(Counter)  # key -> spellings seen
+        self._trie = {}
+        self._trigrams = defaultdict(set)
+
+    def add(self, place, n=1):
+        key = normalize_place(place)
+        if not key:
+            return
+        if key not in self._counts:
+            self._insert(key)
+        self._counts[key] += n
+        self._labels[key][place.strip()] += n
+
+    def remove(self, place, n=1):
+        key = normalize_place(place)
+        if key not in self._counts:
+            return
+        self._counts[key] -= n
+        labels = self._labels[key]
+        labels[place.strip()] -= n
+        if labels[place.strip()] <= 0:
+            del labels[place.strip()]
+        if self._counts[key] <= 0:
+            del self._counts[key]
+            del self._labels[key]
+            self._delete(key)
+
+    def replace(self, old_places, new_places):
+        for place in old_places:
+            self.remove(place)
+        for place in new_places:
+            self.add(place)
+
+    def _entry_points(self, key):
+        words = key.split(' ')
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def _insert(self, key):
+        for entry in self._entry_points(key):
+            node = self._trie
+            for char in entry:
+                node = node.setdefault(char, {})
+                node.setdefault('', set()).add(key)
+        for gram in trigrams(key):
+            self._trigrams[gram].add(key)
+
+    def _delete(self, key):
+        for entry in self._entry_points(key):
+            node = self._trie
+            for char in entry:
+                node = node.get(char)
+                if node is None:
+                    break
+                node[''].discard(key)
+        for gram in trigrams(key):
+            self._trigrams[gram].discard(key)
+
+    def label(self, key):
+        return self._labels[key].most_common(1)[0][0]
+
+    def suggest(self, query, limit, min_similarity):
+        node = self._trie
+        for char in query:
+            node = node.get(char)
+            if node is None:
+                break
+        matches = node.get('', set()) if node is not None else set()
+        found = heapq.nlargest(limit, matches, key=lambda k: (self._counts[k], k))
+
+        if len(found) < limit:
+            # not enough prefix hits, fall back to trigram similarity
+            grams = trigrams(query)
+            shared = Counter()
+            for gram in grams:
+                for key in self._trigrams.get(gram, ()):
+                    shared[key] += 1
+            scored = []
+            for key, common in shared.items():
+                if key in found:
+                    continue
+                similarity = common / (len(grams) + len(trigrams(key)) - common)
+                if similarity >= min_similarity:
+                    scored.append((similarity, self._counts[key], key))
+            found += [key for _, _, key in heapq.nlargest(limit - len(found), scored)]
+
+        return [self.label(key) for key in found]
+
+
+class PlaceIndex:
+    # the PlaceTable of this process, rebuilt from the table every `max_age`
+    # seconds and kept current by the posts signals in between. A rebuild
+    # runs its queries without the lock, on one request: the others keep
+    # answering from the previous table (or get no suggestion while the
+    # first one loads) and the changes committed meanwhile are replayed on
+    # the new table before it is swapped in.
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._table = None
+            self._built_at = None
+            self._building = False
+            self._pending = None  # changes seen while a new table loads
+
+    def build(self):
+        with self._lock:
+            self._pending = []
+        table = PlaceTable()
+        depart = posts.objects.values_list('depart_place').annotate(n=Count('id'))
+        arrival = posts.objects.values_list('arrival_place').annotate(n=Count('id'))
+        for place, n in list(depart) + list(arrival):
+            table.add(place, n)
+        with self._lock:
+            for old_places, new_places in self._pending or ():
+                table.replace(old_places, new_places)
+            self._pending = None
+            self._table, self._built_at = table, time.monotonic()
+
+    def ensure_built(self):
+        with self._lock:
+            stale = self._built_at is None or (
+                self.max_age is not None
+                and time.monotonic() - self._built_at > self.max_age
+            )
+            if not stale or self._building:
+                return
+            self._building = True
+        try:
+            self.build()
+        finally:
+            with self._lock:
+                self._building = False
+
+    def replace(self, old_places, new_places):
+        # called from the posts signals once the write is committed; until
+        # the first lookup builds the index there is nothing to keep up to date
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((tuple(old_places), tuple(new_places)))
+            if self._table is not None:
+                self._table.replace(old_places, new_places)
+
+    def suggest(self, query, limit=10, min_similarity=0.3):
+        self.ensure_built()
+        query = normalize_place(query)
+        if not query:
+            return []
+        with self._lock:
+            if self._table is None:
+                return []
+            return self._table.suggest(query, limit, min_similarity)
+
+
+place_index = PlaceIndex(max_age=getattr(settings, 'PLACE_INDEX_MAX_AGE', 300))
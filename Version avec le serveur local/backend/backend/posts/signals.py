@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import posts, route_waypoints, waypoint
+from .places import place_index
+
+
+@receiver(post_save, sender=posts)
+def index_places(sender, instance, created, **kwargs):
+    new_places = (instance.depart_place, instance.arrival_place)
+    old_places = () if created else getattr(instance, '_loaded_places', None)
+    # the index follows the committed rows, a rolled back write leaves it alone
+    if old_places is None:
+        # instance not loaded from the db, we can't tell what it replaced
+        transaction.on_commit(place_index.reset)
+    elif tuple(old_places) != new_places:
+        old_places = [p for p in old_places if p is not None]
+        transaction.on_commit(lambda: place_index.replace(old_places, new_places))
+    instance._loaded_places = new_places
+
+
+@receiver(post_save, sender=posts)
+def index_route(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & {'depart_place', 'arrival_place', 'stops'}:
+        return  # reservations etc.
+    route = instance.route_keys()
+    if not created and getattr(instance, '_loaded_route', None) == route:
+        return
+    if not created:
+        waypoint.objects.filter(post=instance).delete()
+    waypoint.objects.bulk_create(route_waypoints(instance.pk, route))
+    instance._loaded_route = route
+
+
+@receiver(post_delete, sender=posts)
+def unindex_places(sender, instance, **kwargs):
+    old_places = (instance.depart_place, instance.arrival_place)
+    transaction.on_commit(lambda: place_index.replace(old_places, ()))
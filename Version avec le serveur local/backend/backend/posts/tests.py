@@ -1,3 +1,184 @@
+import random
+from unittest import mock
+from django.db import transaction
 from django.test import TestCase
+from posts.models import posts, normalize_place, passing_through, waypoint
+from posts.places import PlaceIndex, PlaceTable, place_index
+from posts.geo import covering_cells, encode, haversine_km, near
+from api.testing import make_post, make_user
 
-# Create your tests here.
+
+class NormalizePlaceTests(TestCase):
+
+    def test_accents_case_and_spaces(self):
+        self.assertEqual(normalize_place("  Béjaïa   CENTRE "), "bejaia centre")
+        self.assertEqual(normalize_place("Tizi-Ouzou"), "tizi-ouzou")
+        self.assertEqual(normalize_place(None), "")
+
+
+class PlaceIndexTests(TestCase):
+
+    def setUp(self):
+        self.driver = make_user("driver")
+        self.index = PlaceIndex()
+        for n, (depart, arrival) in enumerate([
+            ("Alger", "Oran"), ("Alger", "Blida"), ("Alger Centre", "Oran"),
+            ("Annaba", "Constantine"), ("Béjaïa", "Alger"),
+        ]):
+            make_post(self.driver, n, depart_place=depart, arrival_place=arrival)
+
+    def test_prefix_ranked_by_usage(self):
+        self.assertEqual(self.index.suggest("al"), ["Alger", "Alger Centre"])
+        self.assertEqual(self.index.suggest("a", limit=1), ["Alger"])
+
+    def test_word_prefix(self):
+        self.assertEqual(self.index.suggest("cent"), ["Alger Centre"])
+
+    def test_accents_and_typos(self):
+        self.assertEqual(self.index.suggest("beja"), ["Béjaïa"])
+        self.assertIn("Constantine", self.index.suggest("constantin"))
+        self.assertIn("Annaba", self.index.suggest("anaba"))
+
+    def test_no_query_per_lookup(self):
+        self.index.suggest("al")
+        with self.assertNumQueries(0):
+            self.index.suggest("or")
+
+    def test_signals_keep_shared_index_current(self):
+        self.addCleanup(place_index.reset)
+        place_index.suggest("x")  # build
+        with self.captureOnCommitCallbacks(execute=True):
+            post = make_post(self.driver, 10, depart_place="Sétif", arrival_place="Alger")
+        self.assertEqual(place_index.suggest("set"), ["Sétif"])
+        post = posts.objects.get(pk=post.pk)
+        post.depart_place = "Tlemcen"
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        self.assertEqual(place_index.suggest("set"), [])
+        self.assertEqual(place_index.suggest("tlem"), ["Tlemcen"])
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(place_index.suggest("tlem"), [])
+
+    def test_rolled_back_write_leaves_no_place(self):
+        self.addCleanup(place_index.reset)
+        place_index.suggest("x")  # build
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                make_post(self.driver, 10, depart_place="Sétif", arrival_place="Alger")
+                transaction.set_rollback(True)
+        self.assertEqual(place_index.suggest("set"), [])
+
+    def test_changes_during_a_rebuild_are_kept(self):
+        index = PlaceIndex()
+        index.suggest("x")  # build
+        previous = index._table
+        index._built_at = None  # stale
+
+        class Loading(PlaceTable):
+            def add(table, place, n=1):
+                if not table._counts:
+                    # a post committed while the rows are read
+                    self.assertEqual(index.suggest("oran"), ["Oran"])  # the previous table answers
+                    index.replace((), ("Sétif",))
+                super().add(place, n)
+
+        with mock.patch("posts.places.PlaceTable", Loading):
+            index.suggest("x")
+        self.assertIsNot(index._table, previous)
+        self.assertEqual(index.suggest("set"), ["Sétif"])
+
+    def test_incremental_updates(self):
+        self.index.suggest("x")  # build
+        self.index.replace((), ("Sétif", "Oran"))
+        self.assertEqual(self.index.suggest("set"), ["Sétif"])
+        self.index.replace(("Sétif", "Oran"), ())
+        self.assertEqual(self.index.suggest("set"), [])
+
+
+class GeoTests(TestCase):
+
+    def test_encode(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode(-25.382708, -49.265506, 8), '6gkzwgjz')
+
+    def test_covering_cells_contain_the_circle(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            lat, lon, radius = rng.uniform(-60, 60), rng.uniform(-179, 179), rng.uniform(0.1, 100)
+            cells = covering_cells(lat, lon, radius, 16)
+            self.assertLessEqual(len(cells), 16)
+            for _ in range(20):
+                # a point of the circle, its geohash starts with one of the cells
+                point = (lat + rng.uniform(-1, 1) * radius / 111.32, lon + rng.uniform(-1, 1) * radius / 111.32)
+                if haversine_km(lat, lon, *point) <= radius:
+                    self.assertTrue(any(encode(*point).startswith(cell) for cell in cells))
+
+    def test_near(self):
+        author = make_user("geo")
+        rng = random.Random(1)
+        for n in range(300):
+            post = make_post(author, n, depart_place="a", arrival_place="b")
+            post.depart_lat, post.depart_lon = 36.75 + rng.uniform(-0.5, 0.5), 3.05 + rng.uniform(-0.5, 0.5)
+            post.save(update_fields=['depart_lat', 'depart_lon'])
+        post.refresh_from_db()
+        self.assertEqual(post.depart_geohash, encode(post.depart_lat, post.depart_lon))
+        for radius in (1, 5, 20):
+            found = set(near(posts.objects.all(), radius, depart=(36.75, 3.05)).values_list('id', flat=True))
+            expected = {
+                pk for pk, lat, lon in posts.objects.values_list('id', 'depart_lat', 'depart_lon')
+                # the flat earth distance is within a few meters at this range
+                if haversine_km(36.75, 3.05, lat, lon) <= radius * 0.999
+            }
+            self.assertLessEqual(expected, found)
+            self.assertLessEqual(len(found - expected), 1)
+
+
+class RouteTests(TestCase):
+
+    def setUp(self):
+        self.author = make_user("route")
+
+    def route(self, post):
+        return list(waypoint.objects.filter(post=post).order_by('position').values_list('key', flat=True))
+
+    def test_waypoints_follow_the_post(self):
+        post = make_post(self.author, 1, depart_place="Alger", arrival_place="Oran")
+        self.assertEqual(self.route(post), ['alger', 'oran'])
+        post.stops = ["Blida", " Chlef "]
+        post.save()
+        self.assertEqual(self.route(post), ['alger', 'blida', 'chlef', 'oran'])
+        post = posts.objects.get(pk=post.pk)
+        post.arrival_place = "Mostaganem"
+        post.save(update_fields=['arrival_place'])
+        self.assertEqual(self.route(post), ['alger', 'blida', 'chlef', 'mostaganem'])
+        post.delete()
+        self.assertFalse(waypoint.objects.exists())
+
+    def test_unchanged_route_not_rewritten(self):
+        post = make_post(self.author, 1, depart_place="Alger", arrival_place="Oran")
+        post = posts.objects.get(pk=post.pk)
+        with self.assertNumQueries(1):
+            post.price = 900
+            post.save()
+        with self.assertNumQueries(1):
+            post.reserved_places = 1
+            post.save(update_fields=['reserved_places'])
+
+    def test_passing_through(self):
+        trips = [
+            make_post(self.author, 1, depart_place="Alger", arrival_place="Oran"),
+            make_post(self.author, 2, depart_place="Oran", arrival_place="Alger"),
+            make_post(self.author, 3, depart_place="Alger", arrival_place="Chlef"),
+        ]
+        trips[0].stops = ["Blida", "Chlef"]
+        trips[0].save()
+        trips[1].stops = ["Chlef", "Blida"]
+        trips[1].save()
+        names = {trip.pk: f"trip-{n}" for n, trip in enumerate(trips, 1)}
+        found = lambda *places: sorted(names[pk] for pk in posts.objects.filter(pk__in=passing_through(*places)).values_list('pk', flat=True))
+        self.assertEqual(found("blida", "chlef"), ["trip-1"])
+        self.assertEqual(found("Chlef", "Blida"), ["trip-2"])
+        self.assertEqual(found("alger", "chlef"), ["trip-1", "trip-3"])
+        self.assertEqual(found("chlef"), ["trip-1", "trip-2"])  # trip-3 ends there
+        self.assertEqual(found("oran", "oran"), [])
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from users.models import profile , comments_rating
+from users.models import profile , comments_rating, image_job
 # Register your models here.
 admin.site.register(profile)
 admin.site.register(comments_rating)
+admin.site.register(image_job)
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import posixpath
+import re
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, ImageStat, features
+
+# profile pictures and permis scans are re-encoded once at upload: rotated
+# upright, EXIF (gps, camera...) dropped, capped to MAX_SIZE px, and saved
+# under the hash of their content next to fixed size thumbnails. A given
+# name therefore never changes content and can be cached forever.
+MAX_SIZE = 1600
+THUMBNAIL_SIZES = (64, 128, 512)
+JPEG_QUALITY = 85
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXT = '.webp' if THUMBNAIL_FORMAT == 'WEBP' else '.jpg'
+
+# a permis / id scan below this (shortest side, px) can't be read by a human
+DOCUMENT_MIN_SIDE = 400
+DOCUMENT_MIN_CONTRAST = 8  # stddev of the grey levels, blank or black photos are below
+
+PROCESSED_NAME = re.compile(r'^[0-9a-f]{20}\.jpg$')
+# a processed image or one of its thumbnails, the name is a hash of the content
+HASHED_NAME = re.compile(r'^[0-9a-f]{20}(?:_\d+)?\.(?:jpg|webp)$')
+THUMBNAIL_NAME = re.compile(r'^(.*[0-9a-f]{20})_\d+\.(?:jpg|webp)$')
+
+
+def is_processed(name):
+    return bool(name) and bool(PROCESSED_NAME.match(posixpath.basename(name)))
+
+
+def is_immutable(name):
+    # processed files and thumbnails never change content under their name
+    return bool(HASHED_NAME.match(posixpath.basename(name)))
+
+
+def thumbnail_name(name, size):
+    stem, _ = posixpath.splitext(name)
+    return f"{stem}_{size}{THUMBNAIL_EXT}"
+
+
+def source_name(name):
+    # the processed image a thumbnail was made from, the name itself otherwise
+    match = THUMBNAIL_NAME.match(name)
+    return match.group(1) + '.jpg' if match else name
+
+
+def thumbnail_urls(field_file):
+    # {"64": url, ...} for a processed image, None otherwise
+    if not field_file or not is_processed(field_file.name):
+        return None
+    storage = field_file.storage
+    return {str(size): storage.url(thumbnail_name(field_file.name, size)) for size in THUMBNAIL_SIZES}
+
+
+def encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def load_image(field_file):
+    # decoded, upright, RGB (raises PIL.UnidentifiedImageError for junk)
+    with field_file.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def document_problem(image):
+    # why an id / permis scan is unusable, None when it looks fine
+    if min(image.size) < DOCUMENT_MIN_SIDE:
+        return f"image too small ({image.size[0]}x{image.size[1]})"
+    if ImageStat.Stat(image.convert('L')).stddev[0] < DOCUMENT_MIN_CONTRAST:
+        return "image is blank"
+    return None
+
+
+def process_image(field_file, image=None):
+    # re-encodes the stored file of an ImageField and writes its thumbnails,
+    # returns the new name (the caller saves it on the instance)
+    storage = field_file.storage
+    if image is None:
+        image = load_image(field_file)
+    image = image.copy()
+    image.thumbnail((MAX_SIZE, MAX_SIZE), Image.Resampling.LANCZOS)
+
+    data = encode(image, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    directory = posixpath.dirname(field_file.name)
+    name = posixpath.join(directory, hashlib.sha256(data).hexdigest()[:20] + '.jpg')
+    if not storage.exists(name):
+        storage.save(name, ContentFile(data))
+
+    for size in THUMBNAIL_SIZES:
+        thumb_name = thumbnail_name(name, size)
+        if storage.exists(thumb_name):
+            continue
+        thumb = ImageOps.contain(image, (size, size), Image.Resampling.LANCZOS)
+        storage.save(thumb_name, ContentFile(encode(thumb, THUMBNAIL_FORMAT, quality=80)))
+
+    if field_file.name != name:
+        storage.delete(field_file.name)  # the raw upload
+    return name
@@ -0,0 +1,159 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+from .images import THUMBNAIL_SIZES, document_problem, is_processed, load_image, process_image, thumbnail_name
+from .models import image_job, profile
+
+logger = logging.getLogger(__name__)
+
+# uploads are saved raw by the request and an image_job row is queued; the
+# decoding / thumbnails / permis check run after the commit on a small thread
+# pool, or in `manage.py process_images` when IMAGE_WORKERS is 0. The table
+# is the queue, so jobs of a crashed process are picked up again.
+IMAGE_FIELDS = ('user_pic', 'ppermis_ic')
+DOCUMENT_FIELDS = ('ppermis_ic',)
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)  # a job running for that long lost its worker
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enqueue_images(user, fields=IMAGE_FIELDS):
+    # one job per raw upload: a name already queued or failed (junk that
+    # can't be decoded) is not queued again by the next profile edit. Done
+    # jobs don't count, their raw file is gone and the name can come back
+    uploads = {
+        field: getattr(user, field).name
+        for field in fields
+        if getattr(user, field) and not is_processed(getattr(user, field).name)
+    }
+    if not uploads:
+        return []
+    queued = set(
+        image_job.objects.filter(user=user, name__in=uploads.values())
+        .exclude(status=image_job.done).values_list('field', 'name')
+    )
+    jobs = [image_job(user=user, field=field, name=name) for field, name in uploads.items() if (field, name) not in queued]
+    if not jobs:
+        return []
+    image_job.objects.bulk_create(jobs)
+    if any(job.field in DOCUMENT_FIELDS for job in jobs):
+        user.ppermis_ic_status = 'pending'
+        user.save(update_fields=['ppermis_ic_status'])
+    transaction.on_commit(dispatch)
+    return jobs
+
+
+def discard_replaced(user, previous):
+    # previous: {field: name} before an update. The processed files (and
+    # their thumbnails) replaced by a new upload are deleted after the
+    # commit
+    replaced = [
+        (field, name) for field, name in previous.items()
+        if is_processed(name) and getattr(user, field).name != name
+    ]
+    if replaced:
+        transaction.on_commit(lambda: delete_processed(replaced))
+
+
+def delete_processed(files):
+    for field, name in files:
+        # the names are content hashes, another profile may show the same picture
+        if profile.objects.filter(Q(user_pic=name) | Q(ppermis_ic=name)).exists():
+            continue
+        storage = profile._meta.get_field(field).storage
+        for stale in (name, *(thumbnail_name(name, size) for size in THUMBNAIL_SIZES)):
+            storage.delete(stale)
+
+
+def dispatch():
+    workers = getattr(settings, 'IMAGE_WORKERS', 2)
+    if not workers:
+        return  # left to the process_images command
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-jobs')
+    _pool.submit(_drain)
+
+
+def _drain():
+    try:
+        run_pending()
+    except Exception:
+        logger.exception("image jobs stopped")
+    finally:
+        connections.close_all()  # this thread's connections
+
+
+def claimable():
+    stale = timezone.now() - STALE_AFTER
+    return Q(status=image_job.pending) | Q(status=image_job.running, updated_at__lt=stale)
+
+
+def claim_job():
+    # the conditional UPDATE makes sure two workers never run the same job
+    for job_id in image_job.objects.filter(claimable()).order_by('id').values_list('id', flat=True)[:10]:
+        claimed = image_job.objects.filter(claimable(), pk=job_id).update(
+            status=image_job.running, attempts=F('attempts') + 1, updated_at=timezone.now(),
+        )
+        if claimed:
+            return image_job.objects.get(pk=job_id)
+    return None
+
+
+def finish(job, status, error=''):
+    image_job.objects.filter(pk=job.pk).update(status=status, error=error, updated_at=timezone.now())
+
+
+def run_job(job):
+    storage = profile._meta.get_field(job.field).storage
+    user = profile.objects.filter(pk=job.user_id).first()
+    field_file = getattr(user, job.field) if user else None
+    if not field_file or field_file.name != job.name:
+        # replaced (the new upload has its own job) or removed meanwhile
+        if not is_processed(job.name):
+            storage.delete(job.name)
+        return finish(job, image_job.done)
+
+    try:
+        image = load_image(field_file)
+        problem = document_problem(image) if job.field in DOCUMENT_FIELDS else None
+        name = process_image(field_file, image)
+    except UnidentifiedImageError as e:
+        if job.field in DOCUMENT_FIELDS:
+            profile.objects.filter(pk=job.user_id).update(ppermis_ic_status='rejected')
+        return finish(job, image_job.failed, str(e))
+    except Exception as e:
+        logger.exception("image job %s", job.pk)
+        return finish(job, image_job.failed if job.attempts >= MAX_ATTEMPTS else image_job.pending, repr(e))
+
+    with transaction.atomic():
+        current = profile.objects.select_for_update().filter(pk=job.user_id).first()
+        if current is None or getattr(current, job.field).name != job.name:
+            return finish(job, image_job.done)
+        setattr(current, job.field, name)
+        fields = [job.field]
+        if job.field in DOCUMENT_FIELDS:
+            current.ppermis_ic_status = 'rejected' if problem else 'valid'
+            fields.append('ppermis_ic_status')
+        current.save(update_fields=fields)  # through save() for the cache signals
+    finish(job, image_job.done, problem or '')
+
+
+def run_pending(limit=None):
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from users.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Run the queued image jobs (re-encoding, thumbnails, permis checks), polling for new ones unless --once"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+        parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls")
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending()
+            if count:
+                self.stdout.write(f"Processed {count} image jobs")
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute profile.rating_count / rating_sum from comments_rating"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings of {updated} profiles"))
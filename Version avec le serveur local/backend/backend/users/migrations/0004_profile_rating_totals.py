@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:43
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_totals(apps, schema_editor):
+    # users.models.rebuild_ratings as of this migration
+    profile = apps.get_model('users', 'profile')
+    comments_rating = apps.get_model('users', 'comments_rating')
+    received = comments_rating.objects.filter(received_user=models.OuterRef('pk')).values('received_user')
+    profile.objects.update(
+        rating_count=Coalesce(models.Subquery(received.annotate(n=models.Count('id')).values('n')), 0),
+        rating_sum=Coalesce(models.Subquery(received.annotate(n=models.Sum('rating')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_profile_ppermis_ic_alter_profile_user_pic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_profile_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments_rating',
+            index=models.Index(fields=['received_user', '-id'], name='comments_received_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comments_rating',
+            index=models.Index(fields=['author_comment', '-id'], name='comments_author_page_idx'),
+        ),
+    ]
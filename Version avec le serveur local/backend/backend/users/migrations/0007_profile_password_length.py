@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='password',
+            field=models.CharField(max_length=128),
+        ),
+    ]
@@ -3,9 +3,10 @@ from django.contrib.auth.models import User ,AbstractBaseUser, BaseUserManager,
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.db.models.functions import Coalesce
 
 # class profile(models.Model):
 #     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -41,7 +42,7 @@ class profile(AbstractBaseUser,PermissionsMixin):
  # This will auto-increment automatically
     username = models.CharField(max_length=150, unique=True, blank=True)  # Allow blank username
     phone_number = PhoneNumberField(blank=True, null=True) #need to specifie the path in the data base 
-    password =models.CharField(max_length=50) # path to store i data base(_(""), max_length=50)
+    password =models.CharField(max_length=128) # holds the hash (pbkdf2 is ~90 chars, postgres enforces the length)
     conducteur = "conducteur"
     clien = "clien"
     utypes = { conducteur :"conducteur", 
@@ -55,9 +56,14 @@ class profile(AbstractBaseUser,PermissionsMixin):
         max_length=None
     ) #need to specifie the path in the data base 
     age = models.IntegerField(default=0) 
+    # set by the image jobs (users.jobs) once the permis scan has been checked
+    ppermis_ic_status = models.CharField(max_length=10, blank=True, null=True)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # running totals of the comments_rating received, kept by the signals below
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
 
     objects = CustomUserManager()
 
@@ -67,6 +73,12 @@ class profile(AbstractBaseUser,PermissionsMixin):
 
     def __str__(self):
         return self.email
+
+    @property
+    def rating_average(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
     
 
 @receiver(post_save, sender=User)
@@ -81,5 +93,82 @@ class comments_rating (models.Model):
         author_comment = models.ForeignKey(profile, on_delete=models.CASCADE, related_name='author_comment') # the user who rate and write the comment
         received_user= models.ForeignKey(profile , on_delete=models.CASCADE , related_name='received_user') #the user who receveices both comment and rating s
 
+        class Meta:
+            indexes = [
+                models.Index(fields=['received_user', '-id'], name='comments_received_page_idx'),
+                models.Index(fields=['author_comment', '-id'], name='comments_author_page_idx'),
+            ]
+
+        @classmethod
+        def from_db(cls, db, field_names, values):
+            instance = super().from_db(db, field_names, values)
+            instance._loaded_rating = (instance.received_user_id, instance.rating)
+            return instance
+
         def __str__(self):
-            return self.title
\ No newline at end of file
+            return self.title
+
+
+def rebuild_ratings():
+    # recomputes every rating_count / rating_sum from comments_rating in one UPDATE
+    received = comments_rating.objects.filter(received_user=models.OuterRef('pk')).values('received_user')
+    return profile.objects.update(
+        rating_count=Coalesce(models.Subquery(received.annotate(n=models.Count('id')).values('n')), 0),
+        rating_sum=Coalesce(models.Subquery(received.annotate(n=models.Sum('rating')).values('n')), 0),
+    )
+
+
+def add_rating(user_id, count, total):
+    profile.objects.filter(pk=user_id).update(
+        rating_count=models.F('rating_count') + count,
+        rating_sum=models.F('rating_sum') + total,
+    )
+
+
+@receiver(post_save, sender=comments_rating)
+def count_rating(sender, instance, created, **kwargs):
+    if created:
+        add_rating(instance.received_user_id, 1, instance.rating)
+    else:
+        old_user, old_rating = getattr(
+            instance, '_loaded_rating', (instance.received_user_id, instance.rating)
+        )
+        if old_user != instance.received_user_id:
+            add_rating(old_user, -1, -old_rating)
+            add_rating(instance.received_user_id, 1, instance.rating)
+        elif old_rating != instance.rating:
+            add_rating(old_user, 0, instance.rating - old_rating)
+    instance._loaded_rating = (instance.received_user_id, instance.rating)
+
+
+@receiver(post_delete, sender=comments_rating)
+def uncount_rating(sender, instance, **kwargs):
+    old_user, old_rating = getattr(
+        instance, '_loaded_rating', (instance.received_user_id, instance.rating)
+    )
+    add_rating(old_user, -1, -old_rating)
+
+
+class image_job(models.Model):
+    # an uploaded picture waiting to be re-encoded (users.images), run by the
+    # in-process pool or by `manage.py process_images` (see users.jobs)
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    statuses = {pending: "pending", running: "running", done: "done", failed: "failed"}
+
+    user = models.ForeignKey(profile, on_delete=models.CASCADE, related_name='image_jobs')
+    field = models.CharField(max_length=20)
+    name = models.CharField(max_length=255)  # the raw upload, the job is stale once the field moved on
+    status = models.CharField(max_length=10, choices=statuses, default=pending)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='image_job_queue_idx')]
+
+    def __str__(self):
+        return f"{self.field} of {self.user_id} ({self.status})"
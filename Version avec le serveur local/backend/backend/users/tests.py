@@ -1,3 +1,195 @@
-from django.test import TestCase
+import io
+import tempfile
+from PIL import Image
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from users.models import comments_rating, image_job, profile
+from users.images import THUMBNAIL_SIZES, is_processed, thumbnail_name, thumbnail_urls
+from users.jobs import claim_job, run_pending
+from api.testing import make_user
 
-# Create your tests here.
+
+class RatingTotalsTests(TestCase):
+
+    def setUp(self):
+        caches['responses'].clear()
+        self.driver = make_user("driver")
+        self.rider = make_user("rider")
+
+    def rate(self, rating):
+        return comments_rating.objects.create(
+            title="ok", rating=rating, comment="ok",
+            author_comment=self.rider, received_user=self.driver,
+        )
+
+    def totals(self):
+        self.driver.refresh_from_db()
+        return self.driver.rating_count, self.driver.rating_sum, self.driver.rating_average
+
+    def test_create_update_delete(self):
+        self.assertEqual(self.totals(), (0, 0, None))
+        first = self.rate(4)
+        self.rate(1)
+        self.assertEqual(self.totals(), (2, 5, 2.5))
+        first = comments_rating.objects.get(pk=first.pk)
+        first.rating = 5
+        first.save()
+        self.assertEqual(self.totals(), (2, 6, 3.0))
+        first.delete()
+        self.assertEqual(self.totals(), (1, 1, 1.0))
+
+    def test_rebuild_command(self):
+        self.rate(3)
+        self.rate(4)
+        profile.objects.update(rating_count=0, rating_sum=0)
+        call_command("rebuild_ratings", stdout=io.StringIO())
+        self.assertEqual(self.totals(), (2, 7, 3.5))
+        rider = profile.objects.get(pk=self.rider.pk)
+        self.assertEqual((rider.rating_count, rider.rating_sum), (0, 0))
+
+    def test_views_keep_totals(self):
+        client = APIClient()
+        client.force_authenticate(self.rider)
+        response = client.post('/api/user/comments/creat/driver/', {
+            "title": "top", "rating": 5, "comment": "top", "received_user": self.driver.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        response = client.patch('/api/user/comments/update/driver/', {"rating": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totals(), (1, 3, 3.0))
+        profile_data = client.get('/api/user/driver/').data['user']
+        self.assertEqual((profile_data['rating'], profile_data['rating_count']), (3.0, 1))
+        response = client.delete('/api/user/comments/delete/driver/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.totals(), (0, 0, None))
+
+
+def camera_jpeg(size=(3000, 2000), color=(200, 30, 30), noise=False):
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"  # Make
+    exif[0x0112] = 6  # Orientation: rotate 90 cw
+    image = Image.effect_noise(size, 80).convert("RGB") if noise else Image.new("RGB", size, color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    buffer.seek(0)
+    buffer.name = "IMG_0001.jpg"
+    return buffer
+
+
+class ImagePipelineTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def register(self, **files):
+        return APIClient().post('/api/user/register', {
+            "email": "new@example.com", "username": "new", "password": "s3cret-pass", **files,
+        }, format="multipart")
+
+    def test_register_queues_then_processes_picture(self):
+        response = self.register(user_pic=camera_jpeg())
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data["user"]["user_pic_thumbs"])  # not processed yet
+        user = profile.objects.get(email="new@example.com")
+        raw_name = user.user_pic.name
+        self.assertFalse(is_processed(raw_name))
+        self.assertEqual(image_job.objects.get().status, image_job.pending)
+
+        self.assertEqual(run_pending(), 1)
+        user.refresh_from_db()
+        self.assertTrue(is_processed(user.user_pic.name))
+        self.assertEqual(image_job.objects.get().status, image_job.done)
+        with user.user_pic.open('rb') as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.size, (1067, 1600))  # upright and capped
+            self.assertNotIn(0x010F, image.getexif())
+        thumbs = thumbnail_urls(user.user_pic)
+        self.assertEqual(sorted(thumbs, key=int), [str(size) for size in THUMBNAIL_SIZES])
+        for size in THUMBNAIL_SIZES:
+            name = thumbnail_name(user.user_pic.name, size)
+            with user.user_pic.storage.open(name) as stored:
+                self.assertEqual(max(Image.open(stored).size), size)
+        # only the processed file and its thumbnails are kept
+        directory = user.user_pic.storage.listdir("backend/profile/pfimage")[1]
+        self.assertEqual(len(directory), 1 + len(THUMBNAIL_SIZES))
+        self.assertEqual(run_pending(), 0)
+
+    def test_permis_is_checked(self):
+        self.register(ppermis_ic=camera_jpeg(size=(300, 200)))
+        user = profile.objects.get(email="new@example.com")
+        self.assertEqual(user.ppermis_ic_status, 'pending')
+        run_pending()
+        user.refresh_from_db()
+        self.assertEqual(user.ppermis_ic_status, 'rejected')
+        self.assertIn("too small", user.image_jobs.get().error)
+
+        user.ppermis_ic = None
+        user.save()
+        client = APIClient()
+        client.force_authenticate(user)
+        client.patch('/api/user/update', {"ppermis_ic": camera_jpeg(noise=True)}, format="multipart")
+        run_pending()
+        user.refresh_from_db()
+        self.assertEqual(user.ppermis_ic_status, 'valid')
+
+    def test_replaced_upload_skips_stale_job(self):
+        self.register(user_pic=camera_jpeg())
+        user = profile.objects.get(email="new@example.com")
+        first = user.user_pic.name
+        client = APIClient()
+        client.force_authenticate(user)
+        client.patch('/api/user/update', {"user_pic": camera_jpeg(color=(0, 0, 200))}, format="multipart")
+        self.assertEqual(run_pending(), 2)
+        user.refresh_from_db()
+        self.assertFalse(user.user_pic.storage.exists(first))
+        self.assertEqual(set(image_job.objects.values_list('status', flat=True)), {image_job.done})
+        with user.user_pic.open('rb') as stored:
+            self.assertGreater(Image.open(stored).getpixel((0, 0))[2], 150)  # the blue one
+
+    def test_failed_upload_is_not_queued_again(self):
+        junk = io.BytesIO(b"not an image")
+        junk.name = "scan.jpg"
+        self.register()
+        user = profile.objects.get(email="new@example.com")
+        user.user_pic.save("scan.jpg", junk)
+        client = APIClient()
+        client.force_authenticate(user)
+        client.patch('/api/user/update', {"age": 30}, format="multipart")
+        self.assertEqual(run_pending(), 1)
+        job = image_job.objects.get()
+        self.assertEqual(job.status, image_job.failed)
+        self.assertTrue(job.error)
+        client.patch('/api/user/update', {"age": 31}, format="multipart")
+        self.assertEqual(image_job.objects.count(), 1)
+        self.assertEqual(run_pending(), 0)
+
+    def test_replaced_processed_picture_is_deleted(self):
+        self.register(user_pic=camera_jpeg())
+        run_pending()
+        user = profile.objects.get(email="new@example.com")
+        old = user.user_pic.name
+        storage = user.user_pic.storage
+        self.assertTrue(storage.exists(thumbnail_name(old, THUMBNAIL_SIZES[0])))
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch('/api/user/update', {"user_pic": camera_jpeg(color=(0, 0, 200))}, format="multipart")
+        self.assertFalse(storage.exists(old))
+        for size in THUMBNAIL_SIZES:
+            self.assertFalse(storage.exists(thumbnail_name(old, size)))
+
+    def test_worker_command_and_claims(self):
+        self.register(user_pic=camera_jpeg())
+        job = claim_job()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(claim_job())  # already running
+        job.__class__.objects.filter(pk=job.pk).update(status='pending')
+        out = io.StringIO()
+        call_command('process_images', '--once', stdout=out)
+        self.assertIn("Processed 1 image jobs", out.getvalue())